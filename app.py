@@ -1,11 +1,54 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, send_file
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, send_file, g
+from markupsafe import Markup
 import subprocess
 import re
 import os
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
 import secrets
 import json
+import fcntl
+import tempfile
+import threading
+import time
+import math
+import heapq
+import bisect
+import ipaddress
+import operator
+import socket
+import signal
+import atexit
+import sys
+import pwd
+import grp
+import gzip
+import base64
+import io
+import hashlib
+import struct
+import glob
+import select
+import ctypes
+import ctypes.util
+import sqlite3
+import asyncio
+import cProfile
+import pstats
+import marshal
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+from collections import deque, Counter
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec, dsa, ed25519, ed448
+except ImportError:
+    x509 = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
@@ -14,11 +57,150 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 # Configuration
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin')
-EASYRSA_DIR = '/etc/openvpn/server/easy-rsa'
-OPENVPN_DIR = '/etc/openvpn/server'
-CLIENT_CONFIG_DIR = '/root'
-STATUS_LOG = '/var/log/openvpn/status.log'
-STATS_FILE = '/opt/openvpn-admin/client_stats.json'
+EASYRSA_DIR = os.environ.get('EASYRSA_DIR', '/etc/openvpn/server/easy-rsa')
+OPENVPN_DIR = os.environ.get('OPENVPN_DIR', '/etc/openvpn/server')
+CLIENT_CONFIG_DIR = os.environ.get('CLIENT_CONFIG_DIR', '/root')
+STATUS_LOG = os.environ.get('OPENVPN_STATUS', '/var/log/openvpn/status.log')
+DATA_DIR = os.environ.get('DATA_DIR', '/opt/openvpn-admin')
+STATS_FILE = f"{DATA_DIR}/client_stats.json"
+# PATH for commands the panel runs (easyrsa, systemctl, ...)
+COMMAND_PATH = os.environ.get('COMMAND_PATH', '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin')
+PKI_LOCK_FILE = f"{EASYRSA_DIR}/pki/.openvpn-admin.lock"
+RATE_EWMA_SECONDS = int(os.environ.get('RATE_EWMA_SECONDS', 60))
+QUOTA_FILE = f"{DATA_DIR}/quotas.json"
+STATS_SAMPLE_INTERVAL = int(os.environ.get('STATS_SAMPLE_INTERVAL', 60))
+# host:port or unix socket path of the OpenVPN management interface
+MANAGEMENT_ADDRESS = os.environ.get('MANAGEMENT_ADDRESS', '')
+MANAGEMENT_PASSWORD = os.environ.get('MANAGEMENT_PASSWORD', '')
+SERVER_CONF = f"{OPENVPN_DIR}/server.conf"
+SNAPSHOT_FILE = f"{DATA_DIR}/state.snapshot"
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 300))
+SNAPSHOT_MAGIC = b'OVPNADM-SNAPSHOT'
+SNAPSHOT_VERSION = 4
+GZIP_MIN_SIZE = 1024
+# 'easyrsa' forks easyrsa for issuance; 'native' signs in-process (needs cryptography)
+CERT_ENGINE = os.environ.get('CERT_ENGINE', 'easyrsa')
+CERT_KEY_SIZE = int(os.environ.get('CERT_KEY_SIZE', 2048))
+# Pre-generated client keys for the native engine
+KEY_POOL_DIR = f"{EASYRSA_DIR}/pki/private/.pool"
+KEY_POOL_SIZE = int(os.environ.get('KEY_POOL_SIZE', 10))
+KEY_POOL_REFILL_INTERVAL = float(os.environ.get('KEY_POOL_REFILL_INTERVAL', 1))
+CRL_DAYS = int(os.environ.get('CRL_DAYS', 3650))
+# Optional signal (e.g. SIGHUP) sent through the management interface after a CRL update
+CRL_RELOAD_SIGNAL = os.environ.get('CRL_RELOAD_SIGNAL', '')
+# Track connections from management-interface notifications (needs
+# management-client-auth in server.conf; see ConnectionTracker)
+MANAGEMENT_EVENTS = os.environ.get('MANAGEMENT_EVENTS', '').lower() in ('1', 'true', 'yes')
+BYTECOUNT_INTERVAL = int(os.environ.get('BYTECOUNT_INTERVAL', 5))
+# OpenVPN log to build connection history from: a log file (or saved
+# journal export), or journal:<unit> to read the systemd journal
+OPENVPN_LOG = os.environ.get('OPENVPN_LOG', '')
+SESSIONS_DB = f"{DATA_DIR}/sessions.db"
+LOG_INGEST_INTERVAL = int(os.environ.get('LOG_INGEST_INTERVAL', 30))
+LOG_INGEST_BATCH = 5000
+# threaded (Werkzeug server) or asgi (uvicorn: async streaming and restarts,
+# other views on a thread pool of ASGI_WORKER_THREADS)
+SERVER_MODE = os.environ.get('SERVER_MODE', 'threaded')
+ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', 32))
+STREAM_INTERVAL = int(os.environ.get('STREAM_INTERVAL', 5))
+RESTART_TIMEOUT = int(os.environ.get('RESTART_TIMEOUT', 60))
+REGENERATE_WORKERS = int(os.environ.get('REGENERATE_WORKERS', 8))
+# External commands: easyrsa runs one at a time, read-only probes in parallel
+EASYRSA_TIMEOUT = int(os.environ.get('EASYRSA_TIMEOUT', 300))
+PROBE_TIMEOUT = int(os.environ.get('PROBE_TIMEOUT', 10))
+PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY', 4))
+# Longest journalctl run of one connection history ingest
+INGEST_TIMEOUT = int(os.environ.get('INGEST_TIMEOUT', 300))
+# Threads parsing pki/issued certificates when the metadata index is built at startup
+CERT_INDEX_WORKERS = int(os.environ.get('CERT_INDEX_WORKERS', 8))
+# On-demand profiling (/api/debug/*): longest window, deepest sampled stack,
+# tracemalloc frames per allocation and memory snapshots kept for diffs
+PROFILE_MAX_SECONDS = 600
+PROFILE_MAX_DEPTH = 64
+TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC_FRAMES', 25))
+MEMORY_SNAPSHOTS = 5
+COMMAND_KILL_GRACE = 5
+# File change notifications: auto (inotify, else polling), inotify, poll or off
+FILE_WATCHER = os.environ.get('FILE_WATCHER', 'auto')
+WATCH_POLL_INTERVAL = float(os.environ.get('WATCH_POLL_INTERVAL', 2))
+WATCH_DEBOUNCE = 0.2
+# Removed clients remembered for /api/clients?since=; older cursors get a full resync
+CLIENT_TOMBSTONES = 10000
+
+# PKI lock state (re-entrant within the process, flock across processes)
+_pki_thread_lock = threading.RLock()
+_pki_lock_fd = None
+_pki_lock_depth = 0
+
+# Throughput sampler state, keyed by (common name, session key)
+_rate_lock = threading.Lock()
+_session_rates = {}
+_rate_sample_time = 0
+
+# Serializes read-modify-write cycles of the stats file
+_stats_lock = threading.Lock()
+
+# Quota actions found over the limit, run by the stats sampler outside
+# _stats_lock: client name -> 'disconnect' or 'revoke' (guarded by _stats_lock)
+_pending_quota_actions = {}
+
+# Stats accounted at disconnect but not yet written to STATS_FILE; the
+# stats sampler (or shutdown) saves them (guarded by _stats_lock)
+_unsaved_stats = None
+
+# Loaded CA for the native engine: (fingerprints, certificate, private key)
+_ca_cache = None
+_ca_lock = threading.Lock()
+
+# Key pool state: wakes the refill worker, recent generation times, keys handed out
+_key_pool_lock = threading.Lock()
+_key_pool_wakeup = threading.Event()
+_key_pool_generated = deque(maxlen=32)
+_key_pool_consumed = 0
+
+# Native CRL builder state: revoked entries by serial, index.txt version
+# they reflect, last CRL number and whether a new CRL must be signed
+_crl_lock = threading.Lock()
+_crl_revoked = None
+_crl_index_fingerprint = None
+_crl_number = 0
+_crl_dirty = False
+# Fingerprint of the pki/crl.pem we loaded or last wrote ourselves
+_crl_file_fingerprint = None
+
+# Certificate status lookup indexes: (PKI version, indexes)
+_cert_status_cache = None
+_cert_status_lock = threading.Lock()
+
+# Requests currently being served; background work yields while non-zero
+_active_requests = 0
+_active_requests_lock = threading.Lock()
+
+# Rendered clients table rows, keyed by client name: (version, markup)
+_row_cache = {}
+
+# Current or last profiling window (ProfileSession); None until one is started
+_profile_session = None
+_profile_lock = threading.Lock()
+
+# tracemalloc snapshots by id: (taken at, snapshot), oldest first
+_memory_snapshots = {}
+_memory_snapshot_id = 0
+_memory_lock = threading.Lock()
+
+# Latest bulk config regeneration (RegenerationJob)
+_regen_job = None
+_regen_lock = threading.Lock()
+
+# Set once start_background_workers() has run
+_workers_started = False
+
+# Parsed file contents, keyed by path: (fingerprint, value). Each path has
+# exactly one parser; derive other views from its value
+_file_cache = {}
+# Watched paths whose cache entry was validated since their last change event
+_file_cache_clean = set()
+_file_cache_lock = threading.Lock()
 
 def login_required(f):
     @wraps(f)
@@ -28,16 +210,1166 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def run_command(cmd, shell=False):
-    """Run a shell command and return output"""
-    env = os.environ.copy()
-    env['PATH'] = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+class CommandStats:
+    """Run counts and durations of one command of one kind"""
+    __slots__ = ('runs', 'failures', 'timeouts', 'total_seconds', 'max_seconds', 'last_exit')
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_exit = None
+
+    def to_dict(self):
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'avg_seconds': round(self.total_seconds / self.runs, 3) if self.runs else 0,
+            'max_seconds': round(self.max_seconds, 3),
+            'last_exit': self.last_exit
+        }
+
+class CommandExecutor:
+    """Runs external commands with per-kind timeouts and concurrency limits
+
+    Commands are argument vectors and never go through a shell. Each kind
+    maps to (timeout, concurrent runs); a command still running at its
+    timeout is killed together with its process group, since easyrsa
+    forks openssl. Durations and exit codes are kept per command.
+    """
+
+    def __init__(self, kinds, path):
+        self.env = dict(os.environ, PATH=path)
+        self.kinds = {kind: (timeout, threading.BoundedSemaphore(limit))
+                      for kind, (timeout, limit) in kinds.items()}
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.running = {}
+
+    def run(self, argv, kind='probe', cwd=None):
+        """Run argv and return (stdout, stderr, returncode)
+
+        A command that cannot be started returns 127, one that timed out
+        the (negative) signal that killed it, with a note in stderr.
+        """
+        return self.execute(argv, kind, cwd)[:3]
+
+    def execute(self, argv, kind='probe', cwd=None):
+        """Like run(), returning (stdout, stderr, returncode, timed out)"""
+        timeout, slots = self.kinds[kind]
+        with slots:
+            start = time.monotonic()
+            try:
+                proc = subprocess.Popen(argv, cwd=cwd, env=self.env, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        text=True, start_new_session=True)
+            except OSError as e:
+                self.record(kind, argv[0], time.monotonic() - start, 127, False)
+                return '', str(e), 127, False
+            
+            with self.lock:
+                self.running[proc.pid] = (kind, argv[0], start, proc)
+            timed_out = False
+            try:
+                try:
+                    stdout, stderr = proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+                    self.kill(proc)
+                    stdout, stderr = proc.communicate()
+                    stderr += f"\n{argv[0]} timed out after {timeout}s"
+            finally:
+                with self.lock:
+                    self.running.pop(proc.pid, None)
+            self.record(kind, argv[0], time.monotonic() - start, proc.returncode, timed_out)
+            return stdout, stderr, proc.returncode, timed_out
+
+    @contextmanager
+    def stream(self, argv, kind='probe', cwd=None):
+        """Run argv, yielding its stdout (bytes) to read while it runs
+
+        The kind's timeout is enforced by a watchdog that kills the process
+        group, which ends the output; a command still running when the
+        block is left is killed too.
+        """
+        timeout, slots = self.kinds[kind]
+        with slots:
+            start = time.monotonic()
+            try:
+                proc = subprocess.Popen(argv, cwd=cwd, env=self.env, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+            except OSError:
+                self.record(kind, argv[0], time.monotonic() - start, 127, False)
+                raise
+            
+            with self.lock:
+                self.running[proc.pid] = (kind, argv[0], start, proc)
+            expired = threading.Event()
+            def expire():
+                expired.set()
+                self.kill(proc)
+            watchdog = threading.Timer(timeout, expire)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                yield proc.stdout
+            finally:
+                watchdog.cancel()
+                if proc.poll() is None and not expired.is_set():
+                    self.kill(proc)
+                proc.stdout.close()
+                proc.wait()
+                with self.lock:
+                    self.running.pop(proc.pid, None)
+                self.record(kind, argv[0], time.monotonic() - start, proc.returncode, expired.is_set())
+
+    def kill(self, proc):
+        """Terminate a command's process group, escalating to SIGKILL after a grace period"""
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                proc.wait(COMMAND_KILL_GRACE)
+                return
+            except subprocess.TimeoutExpired:
+                continue
+
+    def cancel(self):
+        """Kill every running command (at shutdown, so none outlive the panel)"""
+        with self.lock:
+            procs = [entry[3] for entry in self.running.values()]
+        for proc in procs:
+            self.kill(proc)
+
+    def record(self, kind, command, seconds, returncode, timed_out):
+        with self.lock:
+            stats = self.stats.get((kind, command))
+            if stats is None:
+                stats = self.stats[(kind, command)] = CommandStats()
+            stats.runs += 1
+            stats.failures += returncode != 0
+            stats.timeouts += timed_out
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.last_exit = returncode
+
+    def report(self):
+        """Per-command metrics and the commands currently running"""
+        now = time.monotonic()
+        with self.lock:
+            return {
+                'commands': [{'kind': kind, 'command': command, **stats.to_dict()}
+                             for (kind, command), stats in sorted(self.stats.items())],
+                'running': [{'kind': kind, 'command': command, 'seconds': round(now - start, 1)}
+                            for kind, command, start, _ in self.running.values()]
+            }
+
+command_executor = CommandExecutor({
+    'pki': (EASYRSA_TIMEOUT, 1),
+    'service': (RESTART_TIMEOUT, 1),
+    'ingest': (INGEST_TIMEOUT, 1),
+    'probe': (PROBE_TIMEOUT, PROBE_CONCURRENCY)
+}, COMMAND_PATH)
+
+def run_command(argv, kind='probe', cwd=None):
+    """Run a command through the shared executor and return (stdout, stderr, returncode)"""
+    return command_executor.run(argv, kind, cwd)
+
+def file_fingerprint(path):
+    """Identify a file version by inode, size and mtime (None if missing)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def cached_parse(path, parser):
+    """Return parser(path), reusing the last result while the file is unchanged
+
+    Returns None if the file does not exist. Cached values are shared, so
+    callers must not mutate them unless they own the file (see
+    cache_store()).
+    """
+    watched = file_watcher.covers(path)
+    with _file_cache_lock:
+        if watched:
+            cached = _file_cache.get(path)
+            if cached is not None and path in _file_cache_clean:
+                return cached[1]
+            # Marked before the stat, so a change from here on clears it again
+            _file_cache_clean.add(path)
+    
+    fingerprint = file_fingerprint(path)
+    with _file_cache_lock:
+        if fingerprint is None:
+            _file_cache.pop(path, None)
+            return None
+        cached = _file_cache.get(path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+    
+    value = parser(path)
+    with _file_cache_lock:
+        _file_cache[path] = (fingerprint, value)
+    return value
+
+def cache_store(path, value):
+    """Record a value we just wrote to path as its parsed contents"""
+    fingerprint = file_fingerprint(path)
+    with _file_cache_lock:
+        if fingerprint is None:
+            _file_cache.pop(path, None)
+        else:
+            _file_cache[path] = (fingerprint, value)
+
+def invalidate_cached_file(path=None):
+    """Make cached_parse() re-check a file (or every file) we may have changed
+
+    Change events arrive asynchronously, so writers call this to make
+    their own writes visible immediately.
+    """
+    with _file_cache_lock:
+        if path is None:
+            _file_cache_clean.clear()
+        else:
+            _file_cache_clean.discard(path)
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+                | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class Inotify:
+    """Minimal Linux inotify binding over libc (directory watches only)"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        """Wait up to timeout for events: (changed paths, lost directories, overflowed)"""
+        changed = set()
+        lost = set()
+        overflow = False
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed, lost, overflow
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif directory is None:
+                continue
+            elif mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                lost.add(directory)
+                if mask & IN_IGNORED:
+                    del self.watches[wd]
+            elif name:
+                changed.add(os.path.join(directory, os.fsdecode(name)))
+        return changed, lost, overflow
+
+class FileWatcher:
+    """Change notifications for the files the panel caches
+
+    Watches directories (files are often replaced by rename, which a
+    watch on the file itself would miss) with inotify, falling back to
+    polling their entries' fingerprints. While a path is covered,
+    cached_parse() trusts its cache until a change event arrives instead
+    of stat()ing the file on every call. Callbacks run on the watcher
+    thread, so they should be quick.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directories = {}
+        self.callbacks = []
+        self.listeners = []
+        self.live = set()
+        self.backend = None
+
+    def watch(self, path, callback=None):
+        """Watch one file; callback(path) runs when it changes"""
+        directory, name = os.path.split(path)
+        self.watch_directory(directory, glob.escape(name), callback)
+
+    def watch_directory(self, directory, pattern='*', callback=None):
+        """Watch the directory entries matching pattern; callback(path) runs on changes"""
+        with self.lock:
+            self.directories.setdefault(directory, set()).add(pattern)
+            if callback is not None:
+                self.callbacks.append((directory, pattern, callback))
+
+    def subscribe(self, listener):
+        """Call listener(path) for every change"""
+        self.listeners.append(listener)
+
+    def _matches(self, directory, name):
+        return any(fnmatch(name, pattern) for pattern in self.directories.get(directory, ()))
+
+    def covers(self, path):
+        directory, name = os.path.split(path)
+        return directory in self.live and self._matches(directory, name)
+
+    def _emit(self, paths):
+        for path in paths:
+            invalidate_cached_file(path)
+        for path in paths:
+            directory, name = os.path.split(path)
+            for watched, pattern, callback in self.callbacks:
+                if directory == watched and fnmatch(name, pattern):
+                    try:
+                        callback(path)
+                    except Exception as e:
+                        print(f"Error handling change of {path}: {e}")
+            for listener in self.listeners:
+                try:
+                    listener(path)
+                except Exception as e:
+                    print(f"Error notifying change of {path}: {e}")
+
+    def run(self):
+        """Watch until the process exits, with inotify if available"""
+        if FILE_WATCHER in ('auto', 'inotify'):
+            try:
+                inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                if FILE_WATCHER == 'inotify':
+                    print(f"inotify unavailable, not watching files: {e}")
+                    return
+                print(f"inotify unavailable, polling files instead: {e}")
+            else:
+                self.backend = 'inotify'
+                self._run_inotify(inotify)
+                return
+        self.backend = 'poll'
+        self._run_polling()
+
+    def _run_inotify(self, inotify):
+        while True:
+            for directory in set(self.directories) - self.live:
+                try:
+                    inotify.add(directory)
+                except OSError:
+                    continue
+                self.live.add(directory)
+                # Anything may have changed while the directory was unwatched
+                invalidate_cached_file()
+            
+            changed, lost, overflow = inotify.read(WATCH_POLL_INTERVAL)
+            if changed:
+                # Coalesce the burst of events a single write produces
+                time.sleep(WATCH_DEBOUNCE)
+                more, more_lost, more_overflow = inotify.read(0)
+                changed |= more
+                lost |= more_lost
+                overflow = overflow or more_overflow
+            self.live -= lost
+            if overflow:
+                invalidate_cached_file()
+            paths = sorted(path for path in changed if self._matches(*os.path.split(path)))
+            if paths:
+                self._emit(paths)
+
+    def _run_polling(self):
+        state = {}
+        while True:
+            paths = []
+            for directory in list(self.directories):
+                try:
+                    entries = {e.name: e.stat() for e in os.scandir(directory)
+                               if self._matches(directory, e.name)}
+                except OSError:
+                    self.live.discard(directory)
+                    continue
+                current = {name: (st.st_ino, st.st_size, st.st_mtime_ns) for name, st in entries.items()}
+                previous = state.get(directory)
+                if previous is not None:
+                    for name in current.keys() | previous.keys():
+                        if current.get(name) != previous.get(name):
+                            paths.append(os.path.join(directory, name))
+                state[directory] = current
+                self.live.add(directory)
+            if paths:
+                self._emit(sorted(paths))
+            time.sleep(WATCH_POLL_INTERVAL)
+
+file_watcher = FileWatcher()
+
+def parse_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def management_connect():
+    """Open a socket to the OpenVPN management interface"""
+    if not MANAGEMENT_ADDRESS:
+        raise RuntimeError('Management interface is not configured (MANAGEMENT_ADDRESS)')
+    
+    if MANAGEMENT_ADDRESS.startswith('/'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(MANAGEMENT_ADDRESS)
+    else:
+        host, port = MANAGEMENT_ADDRESS.rsplit(':', 1)
+        sock = socket.create_connection((host, int(port)), timeout=5)
+    
+    if MANAGEMENT_PASSWORD:
+        sock.sendall(f"{MANAGEMENT_PASSWORD}\n".encode())
+    return sock
+
+def management_command(command):
+    """Send one command to the management interface and return its reply"""
+    reply = []
+    with management_connect() as sock:
+        reader = sock.makefile('r', encoding='utf-8', errors='replace')
+        sock.sendall(f"{command}\n".encode())
+        for line in reader:
+            line = line.rstrip('\r\n')
+            # Skip the banner, password prompt and real-time notifications
+            if line.startswith(('>', 'ENTER PASSWORD:')):
+                continue
+            if line.startswith(('SUCCESS:', 'ERROR:')):
+                reply.append(line)
+                break
+            if line == 'END':
+                break
+            reply.append(line)
+        sock.sendall(b"quit\n")
+    return '\n'.join(reply)
+
+@contextmanager
+def pki_lock():
+    """Hold the exclusive PKI lock shared by easyrsa runs and index writers"""
+    global _pki_lock_fd, _pki_lock_depth
+    with _pki_thread_lock:
+        if _pki_lock_depth == 0:
+            _pki_lock_fd = open(PKI_LOCK_FILE, 'a')
+            fcntl.flock(_pki_lock_fd, fcntl.LOCK_EX)
+        _pki_lock_depth += 1
+        try:
+            yield
+        finally:
+            _pki_lock_depth -= 1
+            if _pki_lock_depth == 0:
+                # easyrsa and our own writers may have changed any PKI file
+                invalidate_cached_file()
+                fcntl.flock(_pki_lock_fd, fcntl.LOCK_UN)
+                _pki_lock_fd.close()
+                _pki_lock_fd = None
+
+def run_easyrsa(*args):
+    """Run an easyrsa command while holding the PKI lock"""
+    with pki_lock():
+        return run_command(['./easyrsa', '--batch', *args], 'pki', EASYRSA_DIR)
+
+def publish_crl():
+    """Regenerate the CRL and install it where OpenVPN reads it"""
+    if CERT_ENGINE == 'native':
+        publish_native_crl()
+        return
+    with pki_lock():
+        run_easyrsa(f'--days={CRL_DAYS}', 'gen-crl')
+        with open(f"{EASYRSA_DIR}/pki/crl.pem", 'rb') as f:
+            crl_pem = f.read()
+    write_file_atomic(f"{OPENVPN_DIR}/crl.pem", crl_pem, 0o644, crl_owner() if os.geteuid() == 0 else None)
+
+def index_entry_cn(parts):
+    """Extract the common name from a split index.txt line"""
+    if len(parts) < 6:
+        return None
+    cn_match = re.search(r'/CN=([^/]+)', parts[5])
+    return cn_match.group(1) if cn_match else None
+
+def mutate_pki_index(delete=(), revoke=(), add=(), on_revoke=None):
+    """Apply a batch of index.txt mutations in one locked, atomic pass
+
+    Entries whose CN is in ``delete`` are dropped, valid entries whose CN
+    is in ``revoke`` are marked revoked (calling ``on_revoke(parts)`` for
+    each) and the lines in ``add`` are appended. The new index is written
+    to a temp file next to index.txt and renamed over it. Returns the set
+    of CNs that were touched.
+    """
+    delete = set(delete)
+    revoke = set(revoke) - delete
+    index_file = f"{EASYRSA_DIR}/pki/index.txt"
+    touched = set()
+
+    with pki_lock():
+        if not os.path.exists(index_file):
+            return touched
+
+        revoked_at = datetime.utcnow().strftime('%y%m%d%H%M%SZ')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_file), prefix='.index.txt.')
+        try:
+            with open(index_file, 'r') as src, os.fdopen(fd, 'w') as dst:
+                for line in src:
+                    parts = line.rstrip('\n').split('\t')
+                    cn = index_entry_cn(parts)
+                    if cn in delete:
+                        touched.add(cn)
+                        continue
+                    if cn in revoke and parts[0] == 'V':
+                        parts[0] = 'R'
+                        parts[2] = revoked_at
+                        line = '\t'.join(parts) + '\n'
+                        touched.add(cn)
+                        if on_revoke is not None:
+                            on_revoke(parts)
+                    dst.write(line)
+                for line in add:
+                    dst.write(line)
+                    touched.add(index_entry_cn(line.rstrip('\n').split('\t')))
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.chmod(tmp_path, os.stat(index_file).st_mode & 0o7777)
+            os.replace(tmp_path, index_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return touched
+
+def revoke_clients(client_names):
+    """Revoke the current certificates of the given clients and publish the CRL"""
+    with pki_lock():
+        if CERT_ENGINE == 'native':
+            native_revoke_clients(client_names)
+        else:
+            for client_name in client_names:
+                # Fails harmlessly for clients without a valid certificate
+                run_easyrsa('revoke', client_name)
+
+        publish_crl()
+
+def delete_clients(client_names):
+    """Revoke, remove files for and drop index entries of the given clients"""
+    with pki_lock():
+        revoke_clients(client_names)
+
+        for client_name in client_names:
+            files_to_delete = [
+                f"{EASYRSA_DIR}/pki/issued/{client_name}.crt",
+                f"{EASYRSA_DIR}/pki/private/{client_name}.key",
+                f"{EASYRSA_DIR}/pki/reqs/{client_name}.req",
+                f"{EASYRSA_DIR}/pki/inline/{client_name}.inline",
+                f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn"
+            ]
+
+            for file_path in files_to_delete:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+        return mutate_pki_index(delete=client_names)
+
+def load_ca():
+    """Load the CA certificate and key for the native engine (cached)"""
+    global _ca_cache
+    if x509 is None:
+        raise RuntimeError('The native certificate engine needs the cryptography package')
+    
+    ca_cert_file = f"{EASYRSA_DIR}/pki/ca.crt"
+    ca_key_file = f"{EASYRSA_DIR}/pki/private/ca.key"
+    fingerprints = (file_fingerprint(ca_cert_file), file_fingerprint(ca_key_file))
+    
+    with _ca_lock:
+        if _ca_cache is None or _ca_cache[0] != fingerprints:
+            with open(ca_cert_file, 'rb') as f:
+                ca_cert = x509.load_pem_x509_certificate(f.read())
+            with open(ca_key_file, 'rb') as f:
+                ca_key = serialization.load_pem_private_key(f.read(), password=None)
+            _ca_cache = (fingerprints, ca_cert, ca_key)
+        return _ca_cache[1], _ca_cache[2]
+
+def generate_client_key(ca_key):
+    """Generate a client key of the same family as the CA key"""
+    if isinstance(ca_key, ec.EllipticCurvePrivateKey):
+        return ec.generate_private_key(ca_key.curve)
+    return rsa.generate_private_key(public_exponent=65537, key_size=CERT_KEY_SIZE)
+
+def key_family(ca_key):
+    """Name the kind of client key generate_client_key() makes for this CA"""
+    if isinstance(ca_key, ec.EllipticCurvePrivateKey):
+        return f"ec-{ca_key.curve.name}"
+    return f"rsa{CERT_KEY_SIZE}"
+
+def pooled_key_files(family):
+    """List pooled key files of the given family"""
+    try:
+        names = os.listdir(KEY_POOL_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(KEY_POOL_DIR, name) for name in names
+            if name.startswith(f"{family}-") and name.endswith('.key')]
+
+def take_pooled_key(ca_key):
+    """Remove one ready key from the pool and return it (None if empty)"""
+    global _key_pool_consumed
+    with _key_pool_lock:
+        for path in pooled_key_files(key_family(ca_key)):
+            try:
+                with open(path, 'rb') as f:
+                    key = serialization.load_pem_private_key(f.read(), password=None)
+                os.remove(path)
+            except Exception as e:
+                print(f"Error loading pooled key {path}: {e}")
+                continue
+            _key_pool_consumed += 1
+            _key_pool_wakeup.set()
+            return key
+    return None
+
+def key_pool_stats():
+    """Report pool fill level and recent refill rate"""
+    generated = list(_key_pool_generated)
+    rate = 0.0
+    if len(generated) > 1 and generated[-1] > generated[0]:
+        rate = (len(generated) - 1) / (generated[-1] - generated[0]) * 60
+    enabled = CERT_ENGINE == 'native' and x509 is not None and KEY_POOL_SIZE > 0
+    available = 0
+    if enabled:
+        try:
+            available = len(pooled_key_files(key_family(load_ca()[1])))
+        except Exception:
+            pass
+    return {
+        'enabled': enabled,
+        'available': available,
+        'target': KEY_POOL_SIZE,
+        'refill_per_minute': round(rate, 2),
+        'consumed': _key_pool_consumed
+    }
+
+def key_pool_worker():
+    """Background loop keeping KEY_POOL_SIZE client keys ready
+
+    Runs at low CPU priority and only generates a key while no request is
+    being served, sleeping KEY_POOL_REFILL_INTERVAL between keys.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+    os.makedirs(KEY_POOL_DIR, mode=0o700, exist_ok=True)
+    
+    while True:
+        wait = 60
+        try:
+            ca_key = load_ca()[1]
+            family = key_family(ca_key)
+            
+            # Drop keys made for a different CA key type or size
+            for name in os.listdir(KEY_POOL_DIR):
+                if not name.startswith(f"{family}-"):
+                    os.remove(os.path.join(KEY_POOL_DIR, name))
+            
+            if len(pooled_key_files(family)) < KEY_POOL_SIZE:
+                wait = KEY_POOL_REFILL_INTERVAL
+                if _active_requests == 0:
+                    key = generate_client_key(ca_key)
+                    write_file_atomic(f"{KEY_POOL_DIR}/{family}-{secrets.token_hex(8)}.key", key.private_bytes(
+                        serialization.Encoding.PEM,
+                        serialization.PrivateFormat.PKCS8,
+                        serialization.NoEncryption()))
+                    _key_pool_generated.append(time.time())
+        except Exception as e:
+            print(f"Error refilling key pool: {e}")
+        
+        _key_pool_wakeup.wait(wait)
+        _key_pool_wakeup.clear()
+
+def format_index_date(dt):
+    """Format a datetime the way openssl writes dates into index.txt"""
+    if dt.year >= 2050:
+        return dt.strftime('%Y%m%d%H%M%SZ')
+    return dt.strftime('%y%m%d%H%M%SZ')
+
+def serial_to_hex(serial):
+    """Format a serial as openssl writes it in index.txt (even-length hex)"""
+    serial_hex = f"{serial:X}"
+    return '0' + serial_hex if len(serial_hex) % 2 else serial_hex
+
+def new_serial():
+    """Pick a random 128-bit serial (as easyrsa does) unused in index.txt"""
+    used = set()
+    index_file = f"{EASYRSA_DIR}/pki/index.txt"
+    if os.path.exists(index_file):
+        with open(index_file, 'r') as f:
+            for line in f:
+                parts = line.split('\t')
+                if len(parts) >= 4:
+                    used.add(int(parts[3], 16))
+    while True:
+        serial = secrets.randbits(128)
+        if serial and serial not in used and not serial >> 127:
+            return serial
+
+def write_file_atomic(path, data, mode=0o600, owner=None):
+    """Write a file (owner-only by default), replacing it atomically
+
+    ``owner`` is an optional (uid, gid) applied before the rename, so the
+    file never appears with the wrong ownership.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        if owner is not None:
+            os.chown(tmp_path, *owner)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    invalidate_cached_file(path)
+
+def sign_client_certificate(client_name, key, days):
+    """Sign an easyrsa-style client certificate for key with the CA"""
+    ca_cert, ca_key = load_ca()
+    now = datetime.utcnow().replace(microsecond=0)
+    serial = new_serial()
     
-    if shell:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, env=env)
+    csr = (x509.CertificateSigningRequestBuilder()
+           .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, client_name)]))
+           .sign(key, hashes.SHA256()))
+    
+    # Extensions from easyrsa's x509-types/COMMON and x509-types/client
+    cert = (x509.CertificateBuilder()
+            .subject_name(csr.subject)
+            .issuer_name(ca_cert.subject)
+            .public_key(key.public_key())
+            .serial_number(serial)
+            .not_valid_before(now)
+            .not_valid_after(now + timedelta(days=days))
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=False)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+            .add_extension(x509.AuthorityKeyIdentifier(
+                x509.SubjectKeyIdentifier.from_public_key(ca_key.public_key()).digest,
+                [x509.DirectoryName(ca_cert.issuer)],
+                ca_cert.serial_number), critical=False)
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
+            .add_extension(x509.KeyUsage(
+                digital_signature=True, content_commitment=False, key_encipherment=False,
+                data_encipherment=False, key_agreement=False, key_cert_sign=False,
+                crl_sign=False, encipher_only=False, decipher_only=False), critical=False)
+            .sign(ca_key, hashes.SHA256()))
+    
+    return csr, cert, now + timedelta(days=days)
+
+def native_issue_client(client_name, days, key=None, renew=False):
+    """Issue a client certificate in-process, keeping the PKI easyrsa-compatible
+
+    Writes private/<name>.key (unless an existing key is reused),
+    reqs/<name>.req, issued/<name>.crt, certs_by_serial/<serial>.pem and
+    the serial file, and appends the certificate to index.txt. When
+    renewing, the previous certificate of the client is filed under
+    revoked/, marked revoked in the same index update and the CRL is
+    republished.
+    """
+    pki = f"{EASYRSA_DIR}/pki"
+    cert_file = f"{pki}/issued/{client_name}.crt"
+    key_file = f"{pki}/private/{client_name}.key"
+    
+    with pki_lock():
+        if not renew and os.path.exists(cert_file):
+            raise FileExistsError(f'Certificate for {client_name} already exists')
+        
+        write_key = True
+        if key is None and renew and os.path.exists(key_file):
+            with open(key_file, 'rb') as f:
+                key = serialization.load_pem_private_key(f.read(), password=None)
+            write_key = False
+        elif key is None:
+            ca_key = load_ca()[1]
+            key = take_pooled_key(ca_key) or generate_client_key(ca_key)
+        
+        csr, cert, not_after = sign_client_certificate(client_name, key, days)
+        serial_hex = serial_to_hex(cert.serial_number)
+        cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+        
+        if renew and os.path.exists(cert_file):
+            # The previous certificate is revoked below; its key is reused, so it stays
+            previous = x509.load_pem_x509_certificate(extract_pem_certificate(cert_file).encode())
+            file_revoked_client(client_name, serial_to_hex(previous.serial_number), with_key=write_key)
+        
+        if write_key:
+            write_file_atomic(key_file, key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()))
+        write_file_atomic(f"{pki}/reqs/{client_name}.req", csr.public_bytes(serialization.Encoding.PEM), 0o644)
+        write_file_atomic(cert_file, cert_pem, 0o644)
+        if os.path.isdir(f"{pki}/certs_by_serial"):
+            write_file_atomic(f"{pki}/certs_by_serial/{serial_hex}.pem", cert_pem, 0o644)
+        
+        # openssl ca leaves the next serial in the serial file
+        write_file_atomic(f"{pki}/serial", f"{serial_to_hex(cert.serial_number + 1)}\n".encode(), 0o644)
+        
+        index_line = f"V\t{format_index_date(not_after)}\t\t{serial_hex}\tunknown\t/CN={client_name}\n"
+        if renew:
+            index_revoke_clients([client_name], add=[index_line])
+            publish_crl()
+        else:
+            mutate_pki_index(add=[index_line])
+    
+    return cert
+
+def parse_index_date(value):
+    """Parse an index.txt date (YYMMDDHHMMSSZ or YYYYMMDDHHMMSSZ)"""
+    value = value.split(',')[0]
+    return datetime.strptime(value, '%Y%m%d%H%M%SZ' if len(value) == 15 else '%y%m%d%H%M%SZ')
+
+def build_revoked_entry(serial, revoked_at):
+    return (x509.RevokedCertificateBuilder()
+            .serial_number(serial)
+            .revocation_date(revoked_at)
+            .build())
+
+def note_revoked(parts):
+    """Add a revoked index.txt entry to the CRL builder's set"""
+    global _crl_dirty
+    serial = int(parts[3], 16)
+    with _crl_lock:
+        if _crl_revoked is not None and serial not in _crl_revoked:
+            _crl_revoked[serial] = build_revoked_entry(serial, parse_index_date(parts[2]))
+            _crl_dirty = True
+
+def merge_index_revocations():
+    """Merge every revoked entry of index.txt into the CRL builder's set"""
+    global _crl_index_fingerprint
+    index_file = f"{EASYRSA_DIR}/pki/index.txt"
+    fingerprint = file_fingerprint(index_file)
+    if fingerprint is not None:
+        with open(index_file, 'r') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 6 and parts[0] == 'R':
+                    note_revoked(parts)
+    _crl_index_fingerprint = fingerprint
+
+def load_crl_state():
+    """Seed the revoked set from the published CRL and index.txt
+
+    The published CRL is the lasting record of revocations: entries of
+    deleted clients are gone from index.txt but stay revoked.
+    """
+    global _crl_revoked, _crl_number, _crl_dirty, _crl_file_fingerprint
+    revoked = {}
+    crl_number = 0
+    crl_file = f"{EASYRSA_DIR}/pki/crl.pem"
+    crl_fingerprint = file_fingerprint(crl_file)
+    if os.path.exists(crl_file):
+        with open(crl_file, 'rb') as f:
+            crl = x509.load_pem_x509_crl(f.read())
+        for entry in crl:
+            revoked[entry.serial_number] = entry
+        try:
+            crl_number = crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+        except x509.ExtensionNotFound:
+            pass
+    
+    with _crl_lock:
+        _crl_revoked = revoked
+        _crl_number = crl_number
+        _crl_dirty = not os.path.exists(crl_file)
+        _crl_file_fingerprint = crl_fingerprint
+    merge_index_revocations()
+
+def crl_file_changed(path):
+    """Drop the native CRL state when crl.pem was replaced by someone else
+
+    (e.g. easyrsa gen-crl from manage.sh); it is reloaded on next use
+    instead of publishing over the external revocations.
+    """
+    global _crl_revoked
+    with _crl_lock:
+        if _crl_revoked is not None and file_fingerprint(path) != _crl_file_fingerprint:
+            _crl_revoked = None
+
+def index_revoke_clients(client_names, add=()):
+    """Mark clients revoked in index.txt and record their serials for the CRL"""
+    global _crl_index_fingerprint
+    if _crl_revoked is None:
+        load_crl_state()
+    index_file = f"{EASYRSA_DIR}/pki/index.txt"
+    
+    with pki_lock():
+        # Only our own edit happens between the two fingerprints; anything
+        # else changed index.txt and is merged on the next publish
+        known = file_fingerprint(index_file) == _crl_index_fingerprint
+        revoked = []
+        
+        def on_revoke(parts):
+            note_revoked(parts)
+            revoked.append(parts[3])
+        
+        mutate_pki_index(revoke=client_names, add=add, on_revoke=on_revoke)
+        if known:
+            _crl_index_fingerprint = file_fingerprint(index_file)
+    
+    return revoked
+
+def native_revoke_clients(client_names):
+    """Revoke clients in-process, filing their files away as easyrsa does"""
+    pki = f"{EASYRSA_DIR}/pki"
+    with pki_lock():
+        cert_serials = {}
+        for client_name in client_names:
+            cert_file = f"{pki}/issued/{client_name}.crt"
+            if os.path.exists(cert_file):
+                cert = x509.load_pem_x509_certificate(extract_pem_certificate(cert_file).encode())
+                cert_serials[client_name] = serial_to_hex(cert.serial_number)
+        
+        revoked = set(index_revoke_clients(client_names))
+        
+        for client_name, serial_hex in cert_serials.items():
+            if serial_hex in revoked:
+                file_revoked_client(client_name, serial_hex)
+
+def file_revoked_client(client_name, serial_hex, with_key=True):
+    """Move a revoked certificate's files to pki/revoked/*_by_serial, as easyrsa does"""
+    pki = f"{EASYRSA_DIR}/pki"
+    files = [(f"{pki}/issued/{client_name}.crt", 'certs_by_serial', 'crt'),
+             (f"{pki}/reqs/{client_name}.req", 'reqs_by_serial', 'req')]
+    if with_key:
+        files.append((f"{pki}/private/{client_name}.key", 'private_by_serial', 'key'))
+    for source, folder, ext in files:
+        if os.path.exists(source):
+            os.makedirs(f"{pki}/revoked/{folder}", exist_ok=True)
+            os.replace(source, f"{pki}/revoked/{folder}/{serial_hex}.{ext}")
+
+def crl_owner():
+    """Get the uid/gid OpenVPN reads crl.pem as (nobody:nogroup or nobody:nobody)"""
+    try:
+        uid = pwd.getpwnam('nobody').pw_uid
+    except KeyError:
+        return None
+    for group in ('nogroup', 'nobody'):
+        try:
+            return uid, grp.getgrnam(group).gr_gid
+        except KeyError:
+            continue
+    return None
+
+def publish_native_crl():
+    """Sign a CRL in-process if the revoked set changed and install it"""
+    global _crl_number, _crl_dirty, _crl_file_fingerprint
+    with pki_lock():
+        if _crl_revoked is None:
+            load_crl_state()
+        elif file_fingerprint(f"{EASYRSA_DIR}/pki/index.txt") != _crl_index_fingerprint:
+            merge_index_revocations()
+        
+        with _crl_lock:
+            if not _crl_dirty:
+                return False
+            ca_cert, ca_key = load_ca()
+            now = datetime.utcnow().replace(microsecond=0)
+            builder = (x509.CertificateRevocationListBuilder()
+                       .issuer_name(ca_cert.subject)
+                       .last_update(now)
+                       .next_update(now + timedelta(days=CRL_DAYS))
+                       .add_extension(x509.CRLNumber(_crl_number + 1), critical=False)
+                       .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False))
+            for entry in _crl_revoked.values():
+                builder = builder.add_revoked_certificate(entry)
+            crl_pem = builder.sign(ca_key, hashes.SHA256()).public_bytes(serialization.Encoding.PEM)
+            _crl_number += 1
+            _crl_dirty = False
+        
+        write_file_atomic(f"{EASYRSA_DIR}/pki/crl.pem", crl_pem, 0o644)
+        with _crl_lock:
+            _crl_file_fingerprint = file_fingerprint(f"{EASYRSA_DIR}/pki/crl.pem")
+        write_file_atomic(f"{OPENVPN_DIR}/crl.pem", crl_pem, 0o644, crl_owner() if os.geteuid() == 0 else None)
+    
+    if CRL_RELOAD_SIGNAL:
+        try:
+            management_command(f"signal {CRL_RELOAD_SIGNAL}")
+        except Exception as e:
+            print(f"Error signalling OpenVPN after CRL update: {e}")
+    return True
+
+def extract_pem_certificate(cert_file):
+    """Get the PEM block of a certificate file (easyrsa prepends a text dump)"""
+    with open(cert_file, 'r') as f:
+        content = f.read()
+    match = re.search(r'-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----\n?', content, re.S)
+    return match.group(0) if match else content
+
+def read_text(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+def config_templates():
+    """Read the server-side parts shared by every client config"""
+    return {
+        'common': read_text(f"{OPENVPN_DIR}/client-common.txt"),
+        'ca': read_text(f"{OPENVPN_DIR}/ca.crt"),
+        'tls_crypt': read_text(f"{OPENVPN_DIR}/tc.key")
+    }
+
+def render_client_config(client_name, templates, options=()):
+    """Assemble a client config from the templates, the client's PKI files and extra directives"""
+    parts = [
+        templates['common'],
+        '<ca>\n', templates['ca'], '</ca>\n',
+        '<cert>\n', extract_pem_certificate(f"{EASYRSA_DIR}/pki/issued/{client_name}.crt"), '</cert>\n',
+        '<key>\n', read_text(f"{EASYRSA_DIR}/pki/private/{client_name}.key"), '</key>\n',
+        '<tls-crypt>\n', templates['tls_crypt'], '</tls-crypt>\n'
+    ]
+    parts.extend(f"{option}\n" for option in options)
+    return ''.join(parts)
+
+def write_client_config(client_name, allow_duplicate=False):
+    """Assemble <name>.ovpn from client-common.txt and the client's PKI files"""
+    content = render_client_config(client_name, config_templates(), ['duplicate-cn'] if allow_duplicate else [])
+    with open(f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn", 'w') as f:
+        f.write(content)
+    invalidate_cached_file(f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn")
+
+def write_easyrsa_client_config(client_name, allow_duplicate=False):
+    """Write <name>.ovpn after an easyrsa run, from its inline file when it made one"""
+    inline_file = f"{EASYRSA_DIR}/pki/inline/{client_name}.inline"
+    if not os.path.exists(inline_file):
+        write_client_config(client_name, allow_duplicate)
+        return
+    lines = [line for path in (f"{OPENVPN_DIR}/client-common.txt", inline_file)
+             for line in read_text(path).splitlines(True) if not line.startswith('#')]
+    if allow_duplicate:
+        lines.append('duplicate-cn\n')
+    with open(f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn", 'w') as f:
+        f.writelines(lines)
+    invalidate_cached_file(f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn")
+
+def client_config_options(content):
+    """Per-client directives appended after a config's inline blocks (e.g. duplicate-cn)"""
+    lines = content.splitlines()
+    block_ends = [i for i, line in enumerate(lines) if line.startswith('</')]
+    if not block_ends:
+        return ['duplicate-cn'] if 'duplicate-cn' in lines else []
+    return [line for line in lines[block_ends[-1] + 1:] if line.strip()]
+
+def regenerate_client_config(client_name, templates):
+    """Rebuild one .ovpn from current templates, keeping its per-client options
+
+    Returns 'written', or 'unchanged' when the result is identical to the
+    current file (which is then left untouched).
+    """
+    path = f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn"
+    try:
+        with open(path, 'rb') as f:
+            current = f.read()
+        st = os.stat(path)
+    except FileNotFoundError:
+        current = st = None
+    
+    options = client_config_options(current.decode('utf-8', 'replace')) if current is not None else []
+    content = render_client_config(client_name, templates, options).encode()
+    if content == current:
+        return 'unchanged'
+    
+    if st is None:
+        write_file_atomic(path, content)
     else:
-        result = subprocess.run(cmd.split(), capture_output=True, text=True, env=env)
-    return result.stdout, result.stderr, result.returncode
+        write_file_atomic(path, content, st.st_mode & 0o777, (st.st_uid, st.st_gid))
+    return 'written'
+
+class RegenerationJob:
+    """Progress of a bulk client config regeneration"""
+
+    def __init__(self, client_names):
+        self.id = secrets.token_hex(8)
+        self.lock = threading.Lock()
+        self.total = len(client_names)
+        self.written = 0
+        self.unchanged = 0
+        self.errors = {}
+        self.started = time.time()
+        self.finished = None
+
+    def record(self, client_name, outcome=None, error=None):
+        with self.lock:
+            if error is not None:
+                self.errors[client_name] = error
+            elif outcome == 'written':
+                self.written += 1
+            else:
+                self.unchanged += 1
+
+    def to_dict(self):
+        with self.lock:
+            done = self.written + self.unchanged + len(self.errors)
+            return {
+                'id': self.id,
+                'total': self.total,
+                'done': done,
+                'written': self.written,
+                'unchanged': self.unchanged,
+                'failed': len(self.errors),
+                'errors': dict(self.errors),
+                'running': self.finished is None,
+                'elapsed': round((self.finished or time.time()) - self.started, 3)
+            }
+
+def run_config_regeneration(job, client_names):
+    """Regenerate configs on a worker pool, holding the PKI lock so certificates don't change underneath"""
+    try:
+        with pki_lock():
+            templates = config_templates()
+            with ThreadPoolExecutor(REGENERATE_WORKERS, thread_name_prefix='regenerate') as pool:
+                futures = {pool.submit(regenerate_client_config, name, templates): name for name in client_names}
+                for future in as_completed(futures):
+                    try:
+                        job.record(futures[future], future.result())
+                    except Exception as e:
+                        job.record(futures[future], error=str(e))
+    except Exception as e:
+        # Templates unreadable: nothing could be regenerated
+        for name in client_names:
+            job.record(name, error=str(e))
+    finally:
+        job.finished = time.time()
+
+def start_config_regeneration(client_names):
+    """Start a regeneration job in the background (None if one is running)"""
+    global _regen_job
+    with _regen_lock:
+        if _regen_job is not None and _regen_job.finished is None:
+            return None
+        job = _regen_job = RegenerationJob(client_names)
+    threading.Thread(target=run_config_regeneration, args=(job, client_names),
+                     name='regenerate-configs', daemon=True).start()
+    return job
 
 def parse_openvpn_date(date_str):
     """Convert OpenVPN date format (YYMMDDHHMMSSZ) to readable date (YYYY-MM-DD)"""
@@ -59,121 +1391,1471 @@ def format_bytes(bytes_val):
     except:
         return "0 B"
 
+def format_rate(bytes_per_sec):
+    """Convert a byte rate to human readable format"""
+    return f"{format_bytes(bytes_per_sec)}/s"
+
+app.add_template_filter(format_bytes)
+app.add_template_filter(format_rate)
+
+class ClientRecord:
+    """A client certificate from index.txt, merged with its usage
+
+    Byte counters are kept as integers; formatting happens in the template
+    or in ``to_dict()`` when the record is serialized.
+    """
+    __slots__ = ('name', 'status', 'expiry', 'serial', 'connected', 'ip', 'bytes_sent',
+                 'bytes_received', 'cumulative_sent', 'cumulative_received',
+                 'allow_multi_connection')
+
+    def __init__(self, name, status, expiry, serial=''):
+        self.name = name
+        self.status = status
+        self.expiry = expiry
+        self.serial = serial
+        self.connected = False
+        self.ip = ''
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.cumulative_sent = 0
+        self.cumulative_received = 0
+        self.allow_multi_connection = False
+
+    def apply_usage(self, usage):
+        """Copy current-session data from a Usage entry (or None)"""
+        if usage is not None:
+            self.connected = True
+            self.ip = usage.ip
+            self.bytes_sent = usage.bytes_sent
+            self.bytes_received = usage.bytes_received
+
+    def row_version(self):
+        """Everything the rendered table row depends on, at display precision"""
+        return (self.status, self.expiry, self.connected, self.ip, self.allow_multi_connection,
+                format_bytes(self.bytes_sent), format_bytes(self.bytes_received),
+                format_bytes(self.cumulative_sent), format_bytes(self.cumulative_received))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'expiry': self.expiry,
+            'serial': self.serial,
+            'connected': self.connected,
+            'ip': self.ip,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'bytes_sent_formatted': format_bytes(self.bytes_sent),
+            'bytes_received_formatted': format_bytes(self.bytes_received)
+        }
+
+def parse_index_status(index_file):
+    """Parse index.txt into (serial, cn, flag, expiry, revoked_at) tuples
+
+    This is the only parser cached for index.txt; views such as the
+    client list are derived from its entries. Flags and dates repeat
+    across entries, so equal values share one string.
+    """
+    entries = []
+    shared = {}
+    with open(index_file, 'r') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) >= 6:
+                entries.append((parts[3].upper(), index_entry_cn(parts), shared.setdefault(parts[0], parts[0]),
+                                shared.setdefault(parts[1], parts[1]), shared.setdefault(parts[2], parts[2])))
+    return entries
+
 def get_clients():
     """Get list of all OpenVPN clients"""
+    entries = cached_parse(f"{EASYRSA_DIR}/pki/index.txt", parse_index_status)
+    if entries is None:
+        return []
+    # Records share the entries' strings; each distinct expiry is converted once
+    expiries = {}
     clients = []
-    index_file = f"{EASYRSA_DIR}/pki/index.txt"
-    
-    if not os.path.exists(index_file):
-        return clients
+    for serial, cn, flag, expiry, _ in entries:
+        if cn:
+            if expiry not in expiries:
+                expiries[expiry] = parse_openvpn_date(expiry)
+            clients.append(ClientRecord(cn, 'Active' if flag == 'V' else 'Revoked', expiries[expiry], serial))
+    return clients
+
+def unique_clients(clients):
+    """One ClientRecord per name, preferring the active one
+
+    A renewed client has a revoked and a valid index.txt entry under the
+    same name; views keyed by name (usage, quotas) should list it once.
+    """
+    unique = {}
+    for client in clients:
+        current = unique.get(client.name)
+        if current is None or current.status != 'Active':
+            unique[client.name] = client
+    return list(unique.values())
+
+def parse_multi_connection(config_file):
+    """Check whether a client config has duplicate-cn enabled"""
+    with open(config_file, 'r') as f:
+        return 'duplicate-cn' in f.read()
+
+def client_allows_multi_connection(client_name):
+    """Check (cached) whether a client's .ovpn has duplicate-cn enabled"""
+    try:
+        return bool(cached_parse(f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn", parse_multi_connection))
+    except:
+        return False
+
+class ClientChangeLog:
+    """Change versions of the serialized client records
+
+    update() diffs the current records against the last ones seen and
+    stamps added or changed clients with a new version; removed clients
+    are kept as tombstones so changes_since() can report them. Records
+    are keyed by (name, serial): a renewed client has a revoked and a
+    valid certificate under the same name, each its own record. Versions
+    start from the clock in milliseconds, so cursors issued before a
+    restart are older than every version issued after it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = int(time.time() * 1000)
+        # Cursors below this may have missed removals
+        self.floor = self.version
+        # (name, serial) -> [added version, changed version, record dict]
+        self.records = {}
+        # (name, serial) -> removed version, oldest first
+        self.removed = {}
+
+    def update(self, clients):
+        """Record the current ClientRecords; returns the current version"""
+        with self.lock:
+            version = self.version + 1
+            changed = False
+            seen = set()
+            for client in clients:
+                record = client.to_dict()
+                key = (client.name, client.serial)
+                seen.add(key)
+                entry = self.records.get(key)
+                if entry is None:
+                    self.records[key] = [version, version, record]
+                    self.removed.pop(key, None)
+                    changed = True
+                elif entry[2] != record:
+                    entry[1] = version
+                    entry[2] = record
+                    changed = True
+            for key in [key for key in self.records if key not in seen]:
+                del self.records[key]
+                self.removed[key] = version
+                changed = True
+            while len(self.removed) > CLIENT_TOMBSTONES:
+                key = next(iter(self.removed))
+                self.floor = self.removed.pop(key)
+            if changed:
+                self.version = version
+            return self.version
+
+    def changes_since(self, since):
+        """Records added, changed and removed after version since
+        
+        A cursor from before the oldest tombstone, or from the future
+        (another process), cannot be answered incrementally; the result
+        then has 'reset' set and lists every client as added.
+        """
+        with self.lock:
+            if since < self.floor or since > self.version:
+                return {
+                    'version': self.version,
+                    'reset': True,
+                    'added': [entry[2] for entry in self.records.values()],
+                    'changed': [],
+                    'removed': []
+                }
+            added = []
+            changed = []
+            for entry in self.records.values():
+                if entry[0] > since:
+                    added.append(entry[2])
+                elif entry[1] > since:
+                    changed.append(entry[2])
+            return {
+                'version': self.version,
+                'reset': False,
+                'added': added,
+                'changed': changed,
+                'removed': [{'name': name, 'serial': serial}
+                            for (name, serial), version in self.removed.items() if version > since]
+            }
+
+client_changes = ClientChangeLog()
+
+class Connection:
+    """A single client session from the OpenVPN status log"""
+    __slots__ = ('common_name', 'real_address', 'virtual_address', 'bytes_received',
+                 'bytes_sent', 'connected_since', 'connected_since_epoch', 'client_id',
+                 'rx_rate', 'tx_rate')
+
+    def __init__(self, common_name, real_address, virtual_address, bytes_received,
+                 bytes_sent, connected_since, connected_since_epoch=0, client_id=''):
+        self.common_name = common_name
+        self.real_address = real_address
+        self.virtual_address = virtual_address
+        self.bytes_received = bytes_received
+        self.bytes_sent = bytes_sent
+        self.connected_since = connected_since
+        self.connected_since_epoch = connected_since_epoch
+        self.client_id = client_id
+        self.rx_rate = 0.0
+        self.tx_rate = 0.0
+
+    @property
+    def ip(self):
+        return self.real_address.split(':')[0] if ':' in self.real_address else self.real_address
+
+    @property
+    def session_key(self):
+        """Identify the session across samples, even with duplicate-cn"""
+        return f"{self.client_id or self.real_address}@{self.connected_since_epoch or self.connected_since}"
+
+# Columns of status-version 2/3 records when the log has no HEADER lines
+# (the OpenVPN 2.5+ layout)
+STATUS_DEFAULT_COLUMNS = {
+    'CLIENT_LIST': ('Common Name', 'Real Address', 'Virtual Address', 'Virtual IPv6 Address',
+                    'Bytes Received', 'Bytes Sent', 'Connected Since', 'Connected Since (time_t)',
+                    'Username', 'Client ID', 'Peer ID', 'Data Channel Cipher'),
+    'ROUTING_TABLE': ('Virtual Address', 'Common Name', 'Real Address', 'Last Ref', 'Last Ref (time_t)'),
+    'GLOBAL_STATS': ('Name', 'Value'),
+}
+STATUS_V1_SECTIONS = {
+    'OpenVPN CLIENT LIST': 'CLIENT_LIST',
+    'ROUTING TABLE': 'ROUTING_TABLE',
+    'GLOBAL STATS': 'GLOBAL_STATS',
+}
+STATUS_RECORD_PREFIXES = (b'CLIENT_LIST', b'ROUTING_TABLE', b'GLOBAL_STATS', b'HEADER')
+
+class StatusRecord:
+    """One CLIENT_LIST, ROUTING_TABLE or GLOBAL_STATS row of a status log"""
+    __slots__ = ('kind', 'fields', 'columns')
+
+    def __init__(self, kind, fields, columns):
+        self.kind = kind
+        self.fields = fields
+        self.columns = columns
+
+    def get(self, column, default=''):
+        """Return a field by its header name"""
+        index = self.columns.get(column)
+        if index is None or index >= len(self.fields):
+            return default
+        return self.fields[index]
+
+def column_index(names, start=0):
+    return {name: i for i, name in enumerate(names, start)}
+
+def iter_status_records(data):
+    """Lazily yield the StatusRecords of a status log
+
+    ``data`` is the whole log as bytes. Understands status-version 1
+    (sections of plain CSV), 2 (tagged CSV) and 3 (tagged, tab-separated).
+    For versions 2 and 3 only lines starting with a wanted tag are decoded
+    and split; HEADER lines, when present, define the columns.
+    """
+    if data.startswith(b'OpenVPN CLIENT LIST'):
+        yield from _iter_status_v1_records(data)
+        return
     
-    with open(index_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split('\t')
-            if len(parts) >= 6:
-                status = 'Active' if parts[0] == 'V' else 'Revoked'
-                expiry_date = parse_openvpn_date(parts[1])
-                cn_match = re.search(r'/CN=([^/]+)', parts[5])
-                if cn_match:
-                    client_name = cn_match.group(1)
-                    clients.append({
-                        'name': client_name,
-                        'status': status,
-                        'expiry': expiry_date
-                    })
+    separator = '\t' if data.startswith(b'TITLE\t') else ','
+    # Tagged rows keep their tag as field 0
+    columns = {kind: column_index(names, 1) for kind, names in STATUS_DEFAULT_COLUMNS.items()}
+    for line in io.BytesIO(data):
+        if not line.startswith(STATUS_RECORD_PREFIXES):
+            continue
+        fields = line.rstrip(b'\r\n').decode('utf-8', 'replace').split(separator)
+        kind = fields[0]
+        if kind == 'HEADER':
+            if len(fields) > 1 and fields[1] in columns:
+                columns[fields[1]] = column_index(fields[2:], 1)
+        elif kind in columns:
+            yield StatusRecord(kind, fields, columns[kind])
+
+def _iter_status_v1_records(data):
+    kind = None
+    columns = None
+    for line in io.BytesIO(data):
+        line = line.rstrip(b'\r\n').decode('utf-8', 'replace')
+        if line in STATUS_V1_SECTIONS:
+            kind = STATUS_V1_SECTIONS[line]
+            # GLOBAL STATS is the only section without a column header
+            columns = column_index(STATUS_DEFAULT_COLUMNS[kind]) if kind == 'GLOBAL_STATS' else None
+        elif line == 'END':
+            break
+        elif kind is None or line.startswith('Updated,'):
+            continue
+        elif columns is None:
+            columns = column_index(line.split(','))
+        else:
+            yield StatusRecord(kind, line.split(','), columns)
+
+def read_status_records(path):
+    """Read a status log and lazily yield its StatusRecords
+
+    The file is read with a single read() rather than memory-mapped:
+    OpenVPN rewrites it in place and truncates it, and touching a mapping
+    past the new end of file kills the process with SIGBUS.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return iter_status_records(data)
+
+def status_int(value):
+    return int(value) if value.isdigit() else 0
+
+def record_getter(columns, names):
+    """Build a function returning the named fields of a record's field list
+
+    Resolves the column positions once per header instead of once per
+    row; absent columns and short rows read as ''.
+    """
+    width = max(columns.values(), default=0) + 1
+    getter = operator.itemgetter(*(columns.get(name, width) for name in names))
+    padding = [''] * (width + 1)
+    return lambda fields: getter(fields + padding)
+
+CONNECTION_COLUMNS = ('Common Name', 'Real Address', 'Virtual Address', 'Bytes Received',
+                      'Bytes Sent', 'Connected Since', 'Connected Since (time_t)', 'Client ID')
+
+def connection_from_fields(values):
+    """Build a Connection from CLIENT_LIST values in CONNECTION_COLUMNS order"""
+    client_name, real_address, virtual_address, bytes_received, bytes_sent, \
+        connected_since, connected_since_epoch, client_id = values
+    # Skip UNDEF clients
+    if client_name == 'UNDEF' or not client_name:
+        return None
     
-    return clients
+    return Connection(
+        client_name,
+        real_address,
+        virtual_address,
+        status_int(bytes_received),
+        status_int(bytes_sent),
+        connected_since,
+        status_int(connected_since_epoch),
+        client_id
+    )
 
-def get_connected_clients():
-    """Get list of currently connected clients with usage data"""
-    connected = {}
+def connections_from_records(records):
+    """Build the Connections of a status log from its records"""
+    connections = []
+    unresolved = {}
+    columns = getter = None
     
+    for record in records:
+        if record.kind == 'CLIENT_LIST':
+            if record.columns is not columns:
+                columns = record.columns
+                getter = record_getter(columns, CONNECTION_COLUMNS)
+            conn = connection_from_fields(getter(record.fields))
+            if conn is not None:
+                connections.append(conn)
+                if not conn.virtual_address:
+                    unresolved[(conn.common_name, conn.real_address)] = conn
+        elif record.kind == 'ROUTING_TABLE':
+            # The routing table follows the client list and is only needed
+            # for virtual addresses missing there (status-version 1), so
+            # usually the rest of the log is never parsed
+            if not unresolved:
+                break
+            conn = unresolved.get((record.get('Common Name'), record.get('Real Address')))
+            address = record.get('Virtual Address')
+            if conn is not None and '/' not in address:
+                conn.virtual_address = address
+                del unresolved[(conn.common_name, conn.real_address)]
+    
+    return connections
+
+def read_connections():
+    """Read every client session from the status log"""
     if not os.path.exists(STATUS_LOG):
-        return connected
+        return []
     
     try:
-        with open(STATUS_LOG, 'r') as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            # Parse CLIENT_LIST entries - skip header line
-            if line.startswith('CLIENT_LIST,') and 'Common Name' not in line:
-                parts = line.strip().split(',')
-                if len(parts) >= 13:  # Full CLIENT_LIST has 13 fields
-                    client_name = parts[1]
-                    
-                    # Skip UNDEF clients
-                    if client_name == 'UNDEF' or not client_name:
-                        continue
-                    
-                    real_address = parts[2]
-                    bytes_received = parts[5]
-                    bytes_sent = parts[6]
-                    connected_since = parts[7]
-                    
-                    connected[client_name] = {
-                        'connected': True,
-                        'ip': real_address.split(':')[0] if ':' in real_address else real_address,
-                        'bytes_received': int(bytes_received) if bytes_received.isdigit() else 0,
-                        'bytes_sent': int(bytes_sent) if bytes_sent.isdigit() else 0,
-                        'connected_since': connected_since
-                    }
-    
+        return connections_from_records(read_status_records(STATUS_LOG))
     except Exception as e:
         print(f"Error reading status log: {e}")
         import traceback
         traceback.print_exc()
+        return []
+
+class Usage:
+    """Current usage of one common name, summed over its sessions"""
+    __slots__ = ('ip', 'bytes_received', 'bytes_sent', 'connected_since', 'sessions',
+                 'rx_rate', 'tx_rate')
+
+    def __init__(self, conn):
+        self.ip = conn.ip
+        self.bytes_received = conn.bytes_received
+        self.bytes_sent = conn.bytes_sent
+        self.connected_since = conn.connected_since
+        self.sessions = 1
+        self.rx_rate = conn.rx_rate
+        self.tx_rate = conn.tx_rate
+
+    def add(self, conn):
+        self.bytes_received += conn.bytes_received
+        self.bytes_sent += conn.bytes_sent
+        self.sessions += 1
+        self.rx_rate += conn.rx_rate
+        self.tx_rate += conn.tx_rate
+
+def aggregate_connections(connections):
+    """Combine the sessions of each common name into one Usage entry"""
+    connected = {}
+    
+    for conn in connections:
+        usage = connected.get(conn.common_name)
+        if usage is None:
+            connected[conn.common_name] = Usage(conn)
+        else:
+            usage.add(conn)
     
     return connected
 
-def load_client_stats():
-    """Load cumulative client statistics from file"""
-    if os.path.exists(STATS_FILE):
+class SessionRate:
+    """Last counters and smoothed byte rates of one session"""
+    __slots__ = ('bytes_received', 'bytes_sent', 'rx_rate', 'tx_rate')
+
+    def __init__(self, conn):
+        self.bytes_received = conn.bytes_received
+        self.bytes_sent = conn.bytes_sent
+        self.rx_rate = None
+        self.tx_rate = None
+
+    def to_tuple(self):
+        return (self.bytes_received, self.bytes_sent, self.rx_rate, self.tx_rate)
+
+    @classmethod
+    def from_tuple(cls, values):
+        rate = cls.__new__(cls)
+        rate.bytes_received, rate.bytes_sent, rate.rx_rate, rate.tx_rate = values
+        return rate
+
+def update_rates(connections, sample_time):
+    """Update per-session EWMA byte rates and store them on the connections
+
+    ``sample_time`` is the status log's mtime; OpenVPN only rewrites the
+    file every status interval, so samples that see the same file reuse the
+    previous rates instead of measuring a zero delta.
+    """
+    global _session_rates, _rate_sample_time
+    with _rate_lock:
+        if sample_time > _rate_sample_time:
+            dt = sample_time - _rate_sample_time if _rate_sample_time else 0
+            alpha = 1 - math.exp(-dt / RATE_EWMA_SECONDS) if dt > 0 else 0
+            rates = {}
+            for conn in connections:
+                key = (conn.common_name, conn.session_key)
+                prev = _session_rates.get(key)
+                rate = SessionRate(conn)
+                if prev is not None and dt > 0:
+                    rx = (conn.bytes_received - prev.bytes_received) / dt
+                    tx = (conn.bytes_sent - prev.bytes_sent) / dt
+                    # Counters going backwards mean a reset; start over
+                    if rx >= 0 and tx >= 0:
+                        rate.rx_rate = rx if prev.rx_rate is None else prev.rx_rate + alpha * (rx - prev.rx_rate)
+                        rate.tx_rate = tx if prev.tx_rate is None else prev.tx_rate + alpha * (tx - prev.tx_rate)
+                rates[key] = rate
+            _session_rates = rates
+            _rate_sample_time = sample_time
+        
+        for conn in connections:
+            rate = _session_rates.get((conn.common_name, conn.session_key))
+            if rate is not None and rate.rx_rate is not None:
+                conn.rx_rate = rate.rx_rate
+                conn.tx_rate = rate.tx_rate
+
+def sample_connections():
+    """Sample current connections and update throughput rates from them
+    
+    Uses the event-driven connection table while it is live, otherwise
+    the status log.
+    """
+    if connection_tracker.live:
+        connections, sample_time = connection_tracker.snapshot()
+    else:
         try:
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        except:
+            sample_time = os.path.getmtime(STATUS_LOG)
+        except OSError:
+            sample_time = time.time()
+        connections = read_connections()
+    update_rates(connections, sample_time)
+    return connections
+
+def get_connected_clients():
+    """Get currently connected clients with usage summed over their sessions"""
+    return aggregate_connections(sample_connections())
+
+class ConnectionTracker:
+    """Connection table kept current from management-interface notifications
+
+    Listens for >CLIENT:ESTABLISHED/DISCONNECT and >BYTECOUNT_CLI on a
+    management connection, bootstrapping from ``status 2``. OpenVPN only
+    sends >CLIENT notifications with management-client-auth, which also
+    makes it wait for a verdict on each >CLIENT:CONNECT/REAUTH; the
+    tracker approves those (certificate checks and the CRL still apply).
+    handle_line() is independent of the socket, so the protocol handling
+    can be driven line by line.
+    """
+
+    # Session keys recently closed by a DISCONNECT, kept this many seconds
+    # so a sample taken just before the event does not count them again
+    CLOSED_RETENTION = 600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.live = False
+        self.updated = 0.0
+        self.closed = {}
+        self._event = None
+        self._env = {}
+        self._status = None
+
+    def snapshot(self):
+        """Copy the connection table: (connections, time of last change)"""
+        with self.lock:
+            connections = []
+            for conn in self.connections.values():
+                connections.append(Connection(
+                    conn.common_name, conn.real_address, conn.virtual_address,
+                    conn.bytes_received, conn.bytes_sent, conn.connected_since,
+                    conn.connected_since_epoch, conn.client_id))
+            return connections, self.updated
+
+    def recently_closed(self, session_key):
+        return session_key in self.closed
+
+    def handle_line(self, line):
+        """Process one line from the management interface
+
+        Returns a command to send back, or None.
+        """
+        if line.startswith('>CLIENT:ENV,'):
+            body = line[len('>CLIENT:ENV,'):]
+            if body == 'END':
+                return self._finish_event()
+            name, _, value = body.partition('=')
+            self._env[name] = value
+        elif line.startswith('>CLIENT:'):
+            kind, _, args = line[len('>CLIENT:'):].partition(',')
+            self._event = (kind, args.split(','))
+            self._env = {}
+        elif line.startswith('>BYTECOUNT_CLI:'):
+            cid, bytes_in, bytes_out = line[len('>BYTECOUNT_CLI:'):].split(',')
+            with self.lock:
+                conn = self.connections.get(cid)
+                if conn is not None:
+                    conn.bytes_received = int(bytes_in)
+                    conn.bytes_sent = int(bytes_out)
+                    self.updated = time.time()
+        elif line.startswith('>'):
             pass
+        elif line.startswith('TITLE,'):
+            self._status = [line]
+        elif self._status is not None:
+            if line == 'END':
+                self._load_status(self._status)
+                self._status = None
+            else:
+                self._status.append(line)
+        return None
+
+    def _load_status(self, lines):
+        with self.lock:
+            records = iter_status_records('\n'.join(lines).encode())
+            self.connections = {conn.client_id: conn for conn in connections_from_records(records)}
+            self.updated = time.time()
+            self.live = True
+
+    def _finish_event(self):
+        kind, args = self._event or ('', [])
+        env = self._env
+        self._event = None
+        self._env = {}
+        
+        if kind in ('CONNECT', 'REAUTH') and len(args) >= 2:
+            return f"client-auth-nt {args[0]} {args[1]}"
+        
+        if kind == 'ESTABLISHED' and args:
+            address = env.get('trusted_ip') or env.get('trusted_ip6', '')
+            conn = Connection(
+                env.get('common_name', ''),
+                f"{address}:{env.get('trusted_port', '')}",
+                env.get('ifconfig_pool_remote_ip', ''),
+                0,
+                0,
+                env.get('time_ascii', ''),
+                int(env.get('time_unix', 0) or 0),
+                args[0]
+            )
+            if conn.common_name and conn.common_name != 'UNDEF':
+                with self.lock:
+                    self.connections[args[0]] = conn
+                    self.updated = time.time()
+        
+        elif kind == 'DISCONNECT' and args:
+            with self.lock:
+                conn = self.connections.pop(args[0], None)
+                self.updated = time.time()
+            if conn is not None:
+                conn.bytes_received = int(env.get('bytes_received', conn.bytes_received) or 0)
+                conn.bytes_sent = int(env.get('bytes_sent', conn.bytes_sent) or 0)
+                now = time.time()
+                # Oldest first, so expired keys are always at the front
+                while self.closed:
+                    key = next(iter(self.closed))
+                    if now - self.closed[key] < self.CLOSED_RETENTION:
+                        break
+                    del self.closed[key]
+                self.closed.pop(conn.session_key, None)
+                self.closed[conn.session_key] = now
+                account_disconnect(conn)
+        
+        return None
+
+    def run(self):
+        """Keep a management connection open and process its notifications"""
+        while True:
+            try:
+                with management_connect() as sock:
+                    sock.settimeout(None)
+                    reader = sock.makefile('r', encoding='utf-8', errors='replace')
+                    sock.sendall(f"bytecount {BYTECOUNT_INTERVAL}\nstatus 2\n".encode())
+                    for line in reader:
+                        reply = self.handle_line(line.rstrip('\r\n'))
+                        if reply:
+                            sock.sendall(f"{reply}\n".encode())
+            except Exception as e:
+                print(f"Management event connection failed: {e}")
+            self.live = False
+            time.sleep(5)
+
+connection_tracker = ConnectionTracker()
+
+class AddressSession:
+    """Addresses of one connected session, for the address lookup indexes"""
+    __slots__ = ('common_name', 'real_address', 'real_ip', 'virtual_ips', 'routes', 'connected_since')
+
+    def __init__(self, common_name, real_address, connected_since):
+        self.common_name = common_name
+        self.real_address = real_address
+        self.real_ip = parse_real_ip(real_address)
+        self.virtual_ips = []
+        self.routes = []
+        self.connected_since = connected_since
+
+    def add_address(self, address):
+        """Add a virtual address or iroute network (as printed by OpenVPN)"""
+        parsed = parse_status_address(address)
+        if parsed is None:
+            return
+        if isinstance(parsed, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            if parsed not in self.routes:
+                self.routes.append(parsed)
+        elif parsed not in self.virtual_ips:
+            self.virtual_ips.append(parsed)
+
+    def same_addresses(self, other):
+        return (self.real_ip == other.real_ip and self.virtual_ips == other.virtual_ips
+                and self.routes == other.routes)
+
+    def to_dict(self):
+        return {
+            'name': self.common_name,
+            'real_address': self.real_address,
+            'virtual_addresses': [str(ip) for ip in self.virtual_ips],
+            'routes': [str(network) for network in self.routes],
+            'connected_since': self.connected_since
+        }
+
+# The same addresses reappear on every status refresh, so parsing them is memoized
+@lru_cache(maxsize=65536)
+def parse_status_address(address):
+    """Parse a virtual address (to an IP) or iroute (to a network); None if invalid"""
+    try:
+        if '/' in address:
+            network = ipaddress.ip_network(address, strict=False)
+            return network.network_address if network.num_addresses == 1 else network
+        return ipaddress.ip_address(address)
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=65536)
+def parse_real_ip(real_address):
+    """Extract the IP from a status log real address (None if unparsable)
+
+    Handles ``1.2.3.4:1194``, IPv6 with a trailing ``:port`` and
+    OpenVPN's ``[AF_INET6]`` / ``udp6:`` style prefixes. The status log
+    always appends the port, so that is stripped first; an IPv6 address
+    ending in a group that looks like a port is therefore ambiguous.
+    """
+    address = real_address.rsplit(']', 1)[-1]
+    if address[:3] in ('udp', 'tcp') and ':' in address:
+        address = address.split(':', 1)[1]
+    for candidate in (address.rsplit(':', 1)[0], address):
+        try:
+            return ipaddress.ip_address(candidate.strip('[]'))
+        except ValueError:
+            pass
+    return None
+
+def parse_status_addresses(path):
+    """Read the addresses of every session from a status log
+
+    Returns {(common name, real address): AddressSession}, combining
+    CLIENT_LIST virtual addresses with the ROUTING_TABLE (which is the
+    only source of virtual addresses in status-version 1 and of iroutes).
+    """
+    sessions = {}
+    for record in read_status_records(path):
+        if record.kind not in ('CLIENT_LIST', 'ROUTING_TABLE'):
+            continue
+        common_name = record.get('Common Name')
+        if common_name == 'UNDEF' or not common_name:
+            continue
+        key = (common_name, record.get('Real Address'))
+        address_session = sessions.get(key)
+        if address_session is None:
+            address_session = sessions[key] = AddressSession(key[0], key[1], record.get('Connected Since'))
+        if record.kind == 'CLIENT_LIST':
+            address_session.connected_since = record.get('Connected Since')
+            for column in ('Virtual Address', 'Virtual IPv6 Address'):
+                address_session.add_address(record.get(column))
+        else:
+            address_session.add_address(record.get('Virtual Address'))
+    return sessions
+
+class IPIndex:
+    """Map of IP addresses to sets of values, with CIDR range lookups
+
+    Addresses are also kept as sorted integers per IP version; a network
+    covers one contiguous integer range, so a prefix query is two bisects
+    plus the matching slice.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.keys = {4: [], 6: []}
+
+    def add(self, address, value):
+        key = (address.version, int(address))
+        values = self.values.get(key)
+        if values is None:
+            values = self.values[key] = set()
+            bisect.insort(self.keys[address.version], key[1])
+        values.add(value)
+
+    def discard(self, address, value):
+        key = (address.version, int(address))
+        values = self.values.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del self.values[key]
+            keys = self.keys[address.version]
+            del keys[bisect.bisect_left(keys, key[1])]
+
+    def get(self, address):
+        return self.values.get((address.version, int(address)), ())
+
+    def within(self, network):
+        """Yield (address, values) for every indexed address in network"""
+        keys = self.keys[network.version]
+        lo = bisect.bisect_left(keys, int(network.network_address))
+        hi = bisect.bisect_right(keys, int(network.broadcast_address))
+        for key in keys[lo:hi]:
+            yield ipaddress.ip_address(key), self.values[(network.version, key)]
+
+class AddressIndex:
+    """Connected sessions indexed by virtual IP, real IP and iroute
+
+    refresh() diffs the current sessions against the indexed ones, so a
+    status refresh only touches the sessions that came, went or changed
+    address.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.virtual = IPIndex()
+        self.real = IPIndex()
+        self.source = None
+
+    def _add(self, key, address_session):
+        self.sessions[key] = address_session
+        for ip in address_session.virtual_ips:
+            self.virtual.add(ip, key)
+        if address_session.real_ip is not None:
+            self.real.add(address_session.real_ip, key)
+
+    def _remove(self, key):
+        address_session = self.sessions.pop(key)
+        for ip in address_session.virtual_ips:
+            self.virtual.discard(ip, key)
+        if address_session.real_ip is not None:
+            self.real.discard(address_session.real_ip, key)
+
+    def update(self, sessions):
+        """Apply a new set of sessions; returns (added, removed) counts"""
+        added = removed = 0
+        with self.lock:
+            for key in [key for key in self.sessions if key not in sessions]:
+                self._remove(key)
+                removed += 1
+            for key, address_session in sessions.items():
+                current = self.sessions.get(key)
+                if current is not None and current.same_addresses(address_session):
+                    current.connected_since = address_session.connected_since
+                    continue
+                if current is not None:
+                    self._remove(key)
+                    removed += 1
+                self._add(key, address_session)
+                added += 1
+        return added, removed
+
+    def refresh(self):
+        """Bring the indexes up to date with the live connection table or status log"""
+        if connection_tracker.live:
+            connections, updated = connection_tracker.snapshot()
+            source = ('events', updated)
+            if source == self.source:
+                return
+            sessions = {}
+            for conn in connections:
+                address_session = AddressSession(conn.common_name, conn.real_address, conn.connected_since)
+                address_session.add_address(conn.virtual_address)
+                sessions[(conn.common_name, conn.real_address)] = address_session
+        else:
+            source = ('status', file_fingerprint(STATUS_LOG))
+            if source == self.source:
+                return
+            sessions = cached_parse(STATUS_LOG, parse_status_addresses) or {}
+        self.update(sessions)
+        self.source = source
+
+    def lookup_ip(self, ip):
+        """Sessions using ip as virtual address, connecting from it, or routing it"""
+        with self.lock:
+            return {
+                'virtual': [self.sessions[key].to_dict() for key in sorted(self.virtual.get(ip))],
+                'real': [self.sessions[key].to_dict() for key in sorted(self.real.get(ip))],
+                'routes': [address_session.to_dict() for address_session in self.sessions.values()
+                           if any(ip in network for network in address_session.routes)]
+            }
+
+    def lookup_network(self, network):
+        """Sessions with a virtual or real IP inside network"""
+        with self.lock:
+            virtual = sorted({key for _, keys in self.virtual.within(network) for key in keys})
+            real = sorted({key for _, keys in self.real.within(network) for key in keys})
+            return {
+                'virtual': [self.sessions[key].to_dict() for key in virtual],
+                'real': [self.sessions[key].to_dict() for key in real]
+            }
+
+address_index = AddressIndex()
+
+def load_client_stats():
+    """Load cumulative client statistics from file
+    
+    The parsed stats are cached; only update_cumulative_stats() and
+    account_disconnect() may modify the returned dict (under _stats_lock).
+    Stats accounted since the last save are returned ahead of the file.
+    """
+    if _unsaved_stats is not None:
+        return _unsaved_stats
+    try:
+        stats = cached_parse(STATS_FILE, parse_json)
+        if stats is not None:
+            return stats
+    except:
+        pass
     return {}
 
 def save_client_stats(stats):
     """Save cumulative client statistics to file"""
+    global _unsaved_stats
+    try:
+        with open(STATS_FILE, 'w') as f:
+            json.dump(stats, f, indent=2)
+        cache_store(STATS_FILE, stats)
+        _unsaved_stats = None
+    except Exception as e:
+        print(f"Error saving stats: {e}")
+
+def flush_client_stats():
+    """Save stats accounted at disconnect that are not on disk yet"""
+    with _stats_lock:
+        if _unsaved_stats is not None:
+            save_client_stats(_unsaved_stats)
+
+def load_quotas():
+    """Load quota configuration from file"""
+    if os.path.exists(QUOTA_FILE):
+        try:
+            with open(QUOTA_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {'default': {}, 'clients': {}}
+
+def save_quotas(quotas):
+    """Save quota configuration to file"""
+    with open(QUOTA_FILE, 'w') as f:
+        json.dump(quotas, f, indent=2)
+
+def quota_for(quotas, client_name):
+    """Get the effective quota of a client (its own limits over the default)"""
+    quota = dict(quotas.get('default', {}))
+    quota.update(quotas.get('clients', {}).get(client_name, {}))
+    if not quota.get('daily') and not quota.get('monthly'):
+        return None
+    quota.setdefault('action', 'warn')
+    return quota
+
+def period_usage(entry, now):
+    """Get (daily, monthly) bytes used by a stats entry in the current periods"""
+    usage = entry.get('usage', {})
+    daily = usage.get('daily', 0) if usage.get('day') == now.strftime('%Y-%m-%d') else 0
+    monthly = usage.get('monthly', 0) if usage.get('month') == now.strftime('%Y-%m') else 0
+    return daily, monthly
+
+def add_period_usage(entry, delta, now):
+    """Add newly transferred bytes to the daily and monthly counters"""
+    daily, monthly = period_usage(entry, now)
+    entry['usage'] = {
+        'day': now.strftime('%Y-%m-%d'),
+        'daily': daily + delta,
+        'month': now.strftime('%Y-%m'),
+        'monthly': monthly + delta
+    }
+
+def exceeded_quota(entry, quota, now):
+    """Return 'daily' or 'monthly' if the entry is over quota, else None"""
+    daily, monthly = period_usage(entry, now)
+    if quota.get('daily') and daily >= quota['daily']:
+        return 'daily'
+    if quota.get('monthly') and monthly >= quota['monthly']:
+        return 'monthly'
+    return None
+
+def quota_action(client_name, entry, quota, exceeded, now):
+    """Record that a client is over its quota; returns the action to run, if any
+
+    Warnings and revocations happen once per period; disconnects repeat on
+    every sample while the client keeps reconnecting. Called with
+    _stats_lock held, so nothing slow happens here.
+    """
+    action = quota['action']
+    period = now.strftime('%Y-%m-%d') if exceeded == 'daily' else now.strftime('%Y-%m')
+    state = entry.get('quota', {})
+    first = state.get('exceeded') != exceeded or state.get('period') != period
+    
+    if first:
+        print(f"Client {client_name} exceeded its {exceeded} quota (action: {action})")
+        entry['quota'] = {
+            'exceeded': exceeded,
+            'period': period,
+            'action': action,
+            'at': now.isoformat(timespec='seconds')
+        }
+    
+    if action == 'revoke' and first:
+        return 'revoke'
+    if action in ('disconnect', 'revoke'):
+        return 'disconnect'
+    return None
+
+def run_quota_actions():
+    """Revoke or disconnect the clients found over quota since the last run"""
+    global _pending_quota_actions
+    with _stats_lock:
+        actions, _pending_quota_actions = _pending_quota_actions, {}
+    
+    for client_name, action in actions.items():
+        try:
+            if action == 'revoke':
+                revoke_clients([client_name])
+            management_command(f"kill {client_name}")
+        except Exception as e:
+            print(f"Error enforcing quota for {client_name}: {e}")
+
+def update_cumulative_stats(connections=None):
+    """Update cumulative statistics with current session data
+    
+    Each client keeps the byte counters last seen for every open session.
+    A session that disappears from the status log (or whose counters go
+    backwards) is folded into the client's totals. Bytes transferred since
+    the previous sample are added to the daily/monthly counters, and only
+    clients that transferred something are checked against their quotas;
+    their actions are queued for run_quota_actions() in the stats sampler.
+    """
+    if connections is None:
+        connections = sample_connections()
+    
+    now = datetime.now()
+    quotas = load_quotas()
+    
+    current = {}
+    for conn in connections:
+        # Sessions the event tracker already accounted on disconnect
+        if connection_tracker.recently_closed(conn.session_key):
+            continue
+        current.setdefault(conn.common_name, {})[conn.session_key] = conn
+    
+    with _stats_lock:
+        cumulative = load_client_stats()
+        
+        for client_name in set(current) | set(cumulative):
+            entry = cumulative.setdefault(client_name, {
+                'total_sent': 0,
+                'total_received': 0,
+                'last_sent': 0,
+                'last_received': 0,
+                'sessions': {}
+            })
+            sessions = current.get(client_name, {})
+            delta = 0
+            
+            if 'sessions' not in entry:
+                # Stats written before per-session tracking: if the counters went
+                # backwards the recorded session has ended, otherwise it continues
+                if sessions:
+                    current_sent = sum(c.bytes_sent for c in sessions.values())
+                    current_received = sum(c.bytes_received for c in sessions.values())
+                    if current_sent < entry['last_sent']:
+                        entry['total_sent'] += entry['last_sent']
+                    if current_received < entry['last_received']:
+                        entry['total_received'] += entry['last_received']
+                else:
+                    entry['total_sent'] += entry['last_sent']
+                    entry['total_received'] += entry['last_received']
+            else:
+                previous = entry['sessions']
+                for key, last in previous.items():
+                    conn = sessions.get(key)
+                    if conn is None or conn.bytes_sent < last['sent']:
+                        entry['total_sent'] += last['sent']
+                    if conn is None or conn.bytes_received < last['received']:
+                        entry['total_received'] += last['received']
+                
+                for key, conn in sessions.items():
+                    last = previous.get(key, {'sent': 0, 'received': 0})
+                    delta += conn.bytes_sent - (last['sent'] if conn.bytes_sent >= last['sent'] else 0)
+                    delta += conn.bytes_received - (last['received'] if conn.bytes_received >= last['received'] else 0)
+            
+            entry['sessions'] = {
+                key: {'sent': conn.bytes_sent, 'received': conn.bytes_received}
+                for key, conn in sessions.items()
+            }
+            entry['last_sent'] = sum(c.bytes_sent for c in sessions.values())
+            entry['last_received'] = sum(c.bytes_received for c in sessions.values())
+            
+            if delta:
+                add_period_usage(entry, delta, now)
+                quota = quota_for(quotas, client_name)
+                if quota:
+                    exceeded = exceeded_quota(entry, quota, now)
+                    action = exceeded and quota_action(client_name, entry, quota, exceeded, now)
+                    if action and _pending_quota_actions.get(client_name) != 'revoke':
+                        _pending_quota_actions[client_name] = action
+        
+        save_client_stats(cumulative)
+    
+    return cumulative
+
+def account_disconnect(conn):
+    """Fold a finished session's final byte counts into the cumulative stats
+
+    This runs on the management thread for every DISCONNECT, so it only
+    updates the stats in memory; the next stats sample writes them out.
+    """
+    global _unsaved_stats
+    now = datetime.now()
+    with _stats_lock:
+        cumulative = load_client_stats()
+        entry = cumulative.setdefault(conn.common_name, {
+            'total_sent': 0,
+            'total_received': 0,
+            'last_sent': 0,
+            'last_received': 0,
+            'sessions': {}
+        })
+        if 'sessions' not in entry:
+            entry['total_sent'] += entry['last_sent']
+            entry['total_received'] += entry['last_received']
+            entry['sessions'] = {}
+        
+        sessions = entry['sessions']
+        last = sessions.pop(conn.session_key, {'sent': 0, 'received': 0})
+        entry['total_sent'] += conn.bytes_sent
+        entry['total_received'] += conn.bytes_received
+        entry['last_sent'] = sum(s['sent'] for s in sessions.values())
+        entry['last_received'] = sum(s['received'] for s in sessions.values())
+        
+        delta = max(conn.bytes_sent - last['sent'], 0) + max(conn.bytes_received - last['received'], 0)
+        if delta:
+            add_period_usage(entry, delta, now)
+        
+        _unsaved_stats = cumulative
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    common_name TEXT NOT NULL,
+    real_address TEXT NOT NULL,
+    virtual_address TEXT NOT NULL DEFAULT '',
+    started INTEGER NOT NULL,
+    ended INTEGER,
+    end_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_by_client ON sessions (common_name, started);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (common_name, real_address) WHERE ended IS NULL;
+CREATE TABLE IF NOT EXISTS ingest_state (
+    source TEXT PRIMARY KEY,
+    position TEXT NOT NULL
+);
+"""
+
+_log_iso_time_re = re.compile(r'^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?\s+')
+_log_ctime_re = re.compile(r'^\w{3} (\w{3} +\d+ \d{2}:\d{2}:\d{2} \d{4})\s+')
+_log_connect_re = re.compile(r'(?:^|\s)(?P<address>\S+) \[(?P<cn>[^\]]+)\] Peer Connection Initiated with')
+_log_pool_re = re.compile(r'(?:^|\s)(?P<cn>[^/\s]+)/(?P<address>\S+) MULTI_sva: pool returned IPv4=(?P<virtual>[^,\s]+)')
+_log_disconnect_re = re.compile(
+    r'(?:^|\s)(?P<cn>[^/\s]+)/(?P<address>\S+) SIG\w+\[(?P<reason>[^\]]*)\] received, client-instance (?:exiting|restarting)')
+# Cheap substring test so most log lines never reach the regexes
+_log_event_markers = ('Peer Connection Initiated', 'MULTI_sva', 'client-instance', 'Initialization Sequence Completed')
+
+def session_store():
+    """Open the connection history database, creating it if needed"""
+    os.makedirs(os.path.dirname(SESSIONS_DB), exist_ok=True)
+    db = sqlite3.connect(SESSIONS_DB, timeout=30)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(SESSION_SCHEMA)
+    return db
+
+def parse_log_time(line):
+    """Split a log line into (epoch seconds, message), or (None, line)
+
+    Understands OpenVPN's own timestamps (ISO and ctime style) and
+    journalctl short-iso exports; times without a zone are local.
+    """
+    match = _log_iso_time_re.match(line)
+    if match:
+        date, clock, zone = match.groups()
+        if zone and zone != 'Z' and ':' not in zone:
+            zone = f"{zone[:3]}:{zone[3:]}"
+        stamp = datetime.fromisoformat(f"{date}T{clock}{'+00:00' if zone == 'Z' else zone or ''}")
+        return stamp.timestamp(), line[match.end():]
+    match = _log_ctime_re.match(line)
+    if match:
+        stamp = datetime.strptime(match.group(1), '%b %d %H:%M:%S %Y')
+        return stamp.timestamp(), line[match.end():]
+    return None, line
+
+def apply_log_event(db, timestamp, message):
+    """Record a connect/disconnect found in one log message; returns 1 if it was an event"""
+    if not any(marker in message for marker in _log_event_markers):
+        return 0
+    timestamp = int(timestamp)
+    
+    match = _log_connect_re.search(message)
+    if match:
+        # A session still open for the same address was never seen closing
+        db.execute("UPDATE sessions SET ended = ?, end_reason = 'replaced' "
+                   "WHERE common_name = ? AND real_address = ? AND ended IS NULL",
+                   (timestamp, match['cn'], match['address']))
+        db.execute('INSERT INTO sessions (common_name, real_address, started) VALUES (?, ?, ?)',
+                   (match['cn'], match['address'], timestamp))
+        return 1
+    
+    match = _log_pool_re.search(message)
+    if match:
+        db.execute('UPDATE sessions SET virtual_address = ? '
+                   'WHERE common_name = ? AND real_address = ? AND ended IS NULL',
+                   (match['virtual'], match['cn'], match['address']))
+        return 1
+    
+    match = _log_disconnect_re.search(message)
+    if match:
+        db.execute('UPDATE sessions SET ended = ?, end_reason = ? '
+                   'WHERE common_name = ? AND real_address = ? AND ended IS NULL',
+                   (timestamp, match['reason'], match['cn'], match['address']))
+        return 1
+    
+    if 'Initialization Sequence Completed' in message:
+        # The server (re)started, so every session it had is gone
+        db.execute("UPDATE sessions SET ended = ?, end_reason = 'server-restart' WHERE ended IS NULL",
+                   (timestamp,))
+        return 1
+    return 0
+
+def load_ingest_position(db, source):
+    row = db.execute('SELECT position FROM ingest_state WHERE source = ?', (source,)).fetchone()
+    return row[0] if row else None
+
+def save_ingest_position(db, source, position):
+    db.execute('INSERT OR REPLACE INTO ingest_state (source, position) VALUES (?, ?)', (source, position))
+    db.commit()
+
+def ingest_log_file(db, path):
+    """Ingest new lines of a log file, resuming from the stored byte offset
+
+    Restarts from the beginning when the file was rotated (new inode) or
+    truncated. Only complete lines are consumed, and the offset is
+    committed together with the events of each batch.
+    """
+    st = os.stat(path)
+    position = json.loads(load_ingest_position(db, path) or '{}')
+    offset = position.get('offset', 0)
+    if position.get('inode') != st.st_ino or st.st_size < offset:
+        offset = 0
+    
+    events = 0
+    pending = 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            offset += len(raw)
+            timestamp, message = parse_log_time(raw.decode('utf-8', 'replace').rstrip('\r\n'))
+            if timestamp is not None:
+                events += apply_log_event(db, timestamp, message)
+            pending += 1
+            if pending >= LOG_INGEST_BATCH:
+                save_ingest_position(db, path, json.dumps({'inode': st.st_ino, 'offset': offset}))
+                pending = 0
+    save_ingest_position(db, path, json.dumps({'inode': st.st_ino, 'offset': offset}))
+    return events
+
+def ingest_journal(db, unit):
+    """Ingest new journal entries of a systemd unit, resuming from the stored cursor"""
+    source = f"journal:{unit}"
+    cursor = load_ingest_position(db, source)
+    cmd = ['journalctl', '-u', unit, '-o', 'json', '--no-pager']
+    if cursor:
+        cmd += ['--after-cursor', cursor]
+    
+    events = 0
+    pending = 0
+    with command_executor.stream(cmd, 'ingest') as stdout:
+        for line in stdout:
+            entry = json.loads(line)
+            message = entry.get('MESSAGE')
+            # Binary messages come as byte arrays; they are never OpenVPN events
+            if isinstance(message, str):
+                events += apply_log_event(db, int(entry['__REALTIME_TIMESTAMP']) / 1e6, message)
+            cursor = entry['__CURSOR']
+            pending += 1
+            if pending >= LOG_INGEST_BATCH:
+                save_ingest_position(db, source, cursor)
+                pending = 0
+    if cursor:
+        save_ingest_position(db, source, cursor)
+    return events
+
+def ingest_openvpn_log():
+    """Bring the session store up to date with OPENVPN_LOG"""
+    db = session_store()
+    try:
+        if OPENVPN_LOG.startswith('journal:'):
+            return ingest_journal(db, OPENVPN_LOG[len('journal:'):])
+        return ingest_log_file(db, OPENVPN_LOG)
+    finally:
+        db.close()
+
+def log_ingester():
+    """Background loop ingesting connection history from the OpenVPN log"""
+    while True:
+        try:
+            ingest_openvpn_log()
+        except Exception as e:
+            print(f"Error ingesting OpenVPN log: {e}")
+        time.sleep(LOG_INGEST_INTERVAL)
+
+def parse_time_param(value):
+    """Parse an API time argument given as epoch seconds or ISO 8601"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def client_sessions(client_name, since=None, until=None, limit=100):
+    """Sessions of a client overlapping [since, until], newest first"""
+    now = int(time.time())
+    db = session_store()
+    try:
+        rows = db.execute(
+            'SELECT real_address, virtual_address, started, ended, end_reason FROM sessions '
+            'WHERE common_name = ? AND started <= ? AND (ended IS NULL OR ended >= ?) '
+            'ORDER BY started DESC LIMIT ?',
+            (client_name, until if until is not None else now, since or 0, limit)).fetchall()
+    finally:
+        db.close()
+    
+    return [{
+        'real_address': real_address,
+        'virtual_address': virtual_address,
+        'started': datetime.fromtimestamp(started).isoformat(),
+        'ended': datetime.fromtimestamp(ended).isoformat() if ended is not None else None,
+        'duration': (ended if ended is not None else now) - started,
+        'end_reason': end_reason,
+        'open': ended is None
+    } for real_address, virtual_address, started, ended, end_reason in rows]
+
+def stats_sampler():
+    """Background loop sampling the status log into cumulative stats"""
+    while True:
+        try:
+            update_cumulative_stats()
+        except Exception as e:
+            print(f"Error sampling stats: {e}")
+        run_quota_actions()
+        try:
+            address_index.refresh()
+        except Exception as e:
+            print(f"Error refreshing address indexes: {e}")
+        time.sleep(STATS_SAMPLE_INTERVAL)
+
+def save_snapshot():
+    """Persist parsed file contents and rate counters for a warm restart
+
+    The snapshot is marshal data (tuples, lists, dicts, strings and
+    numbers only), so loading it cannot run code. Cached values holding
+    objects (e.g. AddressSessions) are left out and re-parsed on start.
+    """
+    with _stats_lock, _file_cache_lock, _rate_lock:
+        files = {}
+        for path, (fingerprint, value) in _file_cache.items():
+            try:
+                files[path] = (fingerprint, marshal.dumps(value))
+            except ValueError:
+                continue
+        rates = {key: rate.to_tuple() for key, rate in _session_rates.items()}
+        data = marshal.dumps({'files': files, 'rates': (rates, _rate_sample_time)})
+    
     try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=2)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(SNAPSHOT_FILE), prefix='.state.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + SNAPSHOT_VERSION.to_bytes(2, 'big'))
+            f.write(data)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, SNAPSHOT_FILE)
     except Exception as e:
-        print(f"Error saving stats: {e}")
+        print(f"Error saving snapshot: {e}")
 
-def update_cumulative_stats():
-    """Update cumulative statistics with current session data"""
-    cumulative = load_client_stats()
-    connected = get_connected_clients()
+def load_snapshot():
+    """Restore a snapshot, keeping only entries whose source files are unchanged"""
+    global _session_rates, _rate_sample_time
+    try:
+        with open(SNAPSHOT_FILE, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+                print(f"Ignoring snapshot {SNAPSHOT_FILE}: not owned by us or writable by others")
+                return 0
+            header = f.read(len(SNAPSHOT_MAGIC) + 2)
+            if header != SNAPSHOT_MAGIC + SNAPSHOT_VERSION.to_bytes(2, 'big'):
+                return 0
+            state = marshal.loads(f.read())
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        print(f"Error loading snapshot: {e}")
+        return 0
     
-    for client_name, conn_info in connected.items():
-        if client_name not in cumulative:
-            cumulative[client_name] = {
-                'total_sent': 0,
-                'total_received': 0,
-                'last_sent': 0,
-                'last_received': 0
-            }
-        
-        current_sent = conn_info.get('bytes_sent', 0)
-        current_received = conn_info.get('bytes_received', 0)
-        
-        # If current session values are less than last recorded, it's a new session
-        # Add the previous session's data to cumulative
-        if current_sent < cumulative[client_name]['last_sent']:
-            cumulative[client_name]['total_sent'] += cumulative[client_name]['last_sent']
-        if current_received < cumulative[client_name]['last_received']:
-            cumulative[client_name]['total_received'] += cumulative[client_name]['last_received']
-        
-        # Update last recorded values
-        cumulative[client_name]['last_sent'] = current_sent
-        cumulative[client_name]['last_received'] = current_received
+    restored = 0
+    with _file_cache_lock:
+        for path, (fingerprint, data) in state['files'].items():
+            if file_fingerprint(path) == fingerprint:
+                _file_cache[path] = (fingerprint, marshal.loads(data))
+                restored += 1
+    rates, sample_time = state['rates']
+    with _rate_lock:
+        _session_rates = {key: SessionRate.from_tuple(values) for key, values in rates.items()}
+        _rate_sample_time = sample_time
+    return restored
+
+def snapshot_writer():
+    """Background loop saving a snapshot every SNAPSHOT_INTERVAL seconds"""
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        save_snapshot()
+
+def handle_sigterm(signum, frame):
+    # Exit through SystemExit so atexit handlers (the snapshot) run
+    sys.exit(0)
+
+def watch_files():
+    """Register the files whose changes invalidate caches or trigger refreshes"""
+    pki = f"{EASYRSA_DIR}/pki"
+    file_watcher.watch(f"{pki}/index.txt")
+    file_watcher.watch(f"{pki}/crl.pem", crl_file_changed)
+    file_watcher.watch(STATUS_LOG, lambda path: address_index.refresh())
+    file_watcher.watch(SERVER_CONF)
+    file_watcher.watch_directory(CLIENT_CONFIG_DIR, '*.ovpn')
+    for directory, _ in cert_directories():
+        file_watcher.watch_directory(directory)
+
+def start_background_workers(handle_signals=True):
+    """Start the daemon threads the panel relies on (once per process)
+
+    ASGI servers handle SIGTERM themselves (and may re-raise it rather
+    than exit, skipping atexit), so they pass handle_signals=False and
+    save the snapshot at lifespan shutdown.
+    """
+    global _workers_started
+    if _workers_started:
+        return
+    _workers_started = True
+    restored = load_snapshot()
+    if restored:
+        print(f"Restored {restored} cached files from snapshot")
+    atexit.register(save_snapshot)
+    # Runs before save_snapshot (atexit is last in, first out)
+    atexit.register(flush_client_stats)
+    atexit.register(command_executor.cancel)
+    if handle_signals:
+        signal.signal(signal.SIGTERM, handle_sigterm)
     
-    save_client_stats(cumulative)
-    return cumulative
+    threading.Thread(target=stats_sampler, name='stats-sampler', daemon=True).start()
+    threading.Thread(target=snapshot_writer, name='snapshot-writer', daemon=True).start()
+    if MANAGEMENT_EVENTS:
+        threading.Thread(target=connection_tracker.run, name='management-events', daemon=True).start()
+    if CERT_ENGINE == 'native' and x509 is not None and KEY_POOL_SIZE > 0:
+        threading.Thread(target=key_pool_worker, name='key-pool', daemon=True).start()
+    if OPENVPN_LOG:
+        threading.Thread(target=log_ingester, name='log-ingester', daemon=True).start()
+    if FILE_WATCHER != 'off':
+        watch_files()
+        threading.Thread(target=file_watcher.run, name='file-watcher', daemon=True).start()
+    threading.Thread(target=warm_certificate_index, name='cert-index', daemon=True).start()
+
+def parse_server_conf(config_file):
+    """Get (port, protocol) from server.conf"""
+    server_port = 'Unknown'
+    server_protocol = 'Unknown'
+    with open(config_file, 'r') as f:
+        for line in f:
+            if line.startswith('port '):
+                server_port = line.split()[1].strip()
+            elif line.startswith('proto '):
+                server_protocol = line.split()[1].strip().upper()
+    return server_port, server_protocol
 
 def get_server_stats():
     """Get overall server statistics"""
@@ -181,36 +2863,27 @@ def get_server_stats():
     connected_clients = get_connected_clients()
     
     total = len(clients)
-    active = sum(1 for c in clients if c['status'] == 'Active')
-    revoked = sum(1 for c in clients if c['status'] == 'Revoked')
+    active = sum(1 for c in clients if c.status == 'Active')
+    revoked = sum(1 for c in clients if c.status == 'Revoked')
     connected = len(connected_clients)
     
     # Calculate total bandwidth
-    total_sent = sum(c.get('bytes_sent', 0) for c in connected_clients.values())
-    total_received = sum(c.get('bytes_received', 0) for c in connected_clients.values())
+    total_sent = sum(u.bytes_sent for u in connected_clients.values())
+    total_received = sum(u.bytes_received for u in connected_clients.values())
     
     # Check server status
-    stdout, _, _ = run_command('systemctl is-active openvpn-server@server')
+    stdout, _, _ = run_command(['systemctl', 'is-active', 'openvpn-server@server'])
     server_running = stdout.strip() == 'active'
     
     # Get server IP
-    stdout, _, _ = run_command('hostname -I')
+    stdout, _, _ = run_command(['hostname', '-I'])
     server_ip = stdout.strip().split()[0] if stdout.strip() else 'Unknown'
     
     # Get server port and protocol from config
-    server_port = 'Unknown'
-    server_protocol = 'Unknown'
-    config_file = '/etc/openvpn/server/server.conf'
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, 'r') as f:
-                for line in f:
-                    if line.startswith('port '):
-                        server_port = line.split()[1].strip()
-                    elif line.startswith('proto '):
-                        server_protocol = line.split()[1].strip().upper()
-        except:
-            pass
+    try:
+        server_port, server_protocol = cached_parse(SERVER_CONF, parse_server_conf) or ('Unknown', 'Unknown')
+    except:
+        server_port, server_protocol = 'Unknown', 'Unknown'
     
     return {
         'total_clients': total,
@@ -224,7 +2897,9 @@ def get_server_stats():
         'total_received_formatted': format_bytes(total_received),
         'server_ip': server_ip,
         'server_port': server_port,
-        'protocol': server_protocol
+        'protocol': server_protocol,
+        'key_pool': key_pool_stats(),
+        'commands': command_executor.report()
     }
 
 # Routes
@@ -257,11 +2932,12 @@ def dashboard():
 @app.route('/clients')
 @login_required
 def clients_page():
-    # Update cumulative stats first
-    cumulative_stats = update_cumulative_stats()
+    # Sample the status log once and update cumulative stats from it
+    connections = sample_connections()
+    cumulative_stats = update_cumulative_stats(connections)
     
     clients = get_clients()
-    connected_clients = get_connected_clients()
+    connected_clients = aggregate_connections(connections)
     
     # Calculate totals
     total_cumulative_sent = 0
@@ -269,47 +2945,473 @@ def clients_page():
     
     # Merge client data with connection info
     for client in clients:
-        conn_info = connected_clients.get(client['name'], {})
-        client['connected'] = conn_info.get('connected', False)
-        client['real_address'] = conn_info.get('ip', '')
-        
-        # Current session data (only for connected clients)
-        current_sent = conn_info.get('bytes_sent', 0) if client['connected'] else 0
-        current_received = conn_info.get('bytes_received', 0) if client['connected'] else 0
+        client.apply_usage(connected_clients.get(client.name))
         
         # Get cumulative data from stats file
-        client_cumulative = cumulative_stats.get(client['name'], {})
+        client_cumulative = cumulative_stats.get(client.name, {})
         # Add current session to the stored cumulative
-        cumulative_sent = client_cumulative.get('total_sent', 0) + client_cumulative.get('last_sent', 0)
-        cumulative_received = client_cumulative.get('total_received', 0) + client_cumulative.get('last_received', 0)
-        
-        # Store both current and cumulative
-        client['bytes_sent'] = format_bytes(current_sent) if client['connected'] else '-'
-        client['bytes_received'] = format_bytes(current_received) if client['connected'] else '-'
-        client['cumulative_sent'] = format_bytes(cumulative_sent)
-        client['cumulative_received'] = format_bytes(cumulative_received)
+        client.cumulative_sent = client_cumulative.get('total_sent', 0) + client_cumulative.get('last_sent', 0)
+        client.cumulative_received = client_cumulative.get('total_received', 0) + client_cumulative.get('last_received', 0)
         
         # Add to totals
-        total_cumulative_sent += cumulative_sent
-        total_cumulative_received += cumulative_received
-        
-        client['expiry_date'] = client.get('expiry', 'N/A')
+        total_cumulative_sent += client.cumulative_sent
+        total_cumulative_received += client.cumulative_received
         
         # Check if client has duplicate-cn enabled
-        config_file = f"{CLIENT_CONFIG_DIR}/{client['name']}.ovpn"
-        client['allow_multi_connection'] = False
-        if os.path.exists(config_file):
-            try:
-                with open(config_file, 'r') as f:
-                    content = f.read()
-                    client['allow_multi_connection'] = 'duplicate-cn' in content
-            except:
-                pass
+        client.allow_multi_connection = client_allows_multi_connection(client.name)
     
     return render_template('clients.html', 
-                         clients=clients,
-                         total_cumulative_sent=format_bytes(total_cumulative_sent),
-                         total_cumulative_received=format_bytes(total_cumulative_received))
+                         rows=render_client_rows(clients),
+                         total_cumulative_sent=total_cumulative_sent,
+                         total_cumulative_received=total_cumulative_received)
+
+def render_client_rows(clients):
+    """Render the clients table rows, reusing rows whose data did not change"""
+    global _row_cache
+    template = app.jinja_env.get_template('client_row.html')
+    previous = _row_cache
+    cache = {}
+    
+    for client in clients:
+        version = client.row_version()
+        cached = previous.get(client.name)
+        if cached is None or cached[0] != version:
+            cached = (version, Markup(template.render(client=client)))
+        cache[client.name] = cached
+    
+    # Rebuilding the dict drops rows of deleted clients
+    _row_cache = cache
+    return [cache[client.name][1] for client in clients]
+
+def describe_public_key(key):
+    """Get (type, size in bits, curve name) of a certificate's public key"""
+    if isinstance(key, rsa.RSAPublicKey):
+        return 'RSA', key.key_size, None
+    if isinstance(key, ec.EllipticCurvePublicKey):
+        return 'EC', key.curve.key_size, key.curve.name
+    if isinstance(key, ed25519.Ed25519PublicKey):
+        return 'Ed25519', 256, None
+    if isinstance(key, ed448.Ed448PublicKey):
+        return 'Ed448', 456, None
+    if isinstance(key, dsa.DSAPublicKey):
+        return 'DSA', key.key_size, None
+    return type(key).__name__, None, None
+
+def parse_certificate_metadata(cert_file):
+    """Parse a certificate file into a metadata dict
+
+    Only the fingerprints are available without cryptography; the other
+    fields are then None.
+    """
+    pem = extract_pem_certificate(cert_file)
+    body = ''.join(line for line in pem.splitlines() if not line.startswith('-----'))
+    der = base64.b64decode(body)
+    metadata = dict.fromkeys(('serial', 'subject', 'cn', 'issuer', 'key_type', 'key_size', 'curve',
+                              'signature_algorithm', 'not_before', 'not_after'))
+    metadata['sha256'] = hashlib.sha256(der).hexdigest()
+    metadata['sha1'] = hashlib.sha1(der).hexdigest()
+    if x509 is None:
+        return metadata
+    
+    cert = x509.load_der_x509_certificate(der)
+    cn = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    key_type, key_size, curve = describe_public_key(cert.public_key())
+    metadata.update(
+        serial=serial_to_hex(cert.serial_number),
+        subject=cert.subject.rfc4514_string(),
+        cn=cn[0].value if cn else None,
+        issuer=cert.issuer.rfc4514_string(),
+        key_type=key_type,
+        key_size=key_size,
+        curve=curve,
+        signature_algorithm=cert.signature_algorithm_oid._name,
+        not_before=cert.not_valid_before_utc.replace(tzinfo=None).isoformat() + 'Z',
+        not_after=cert.not_valid_after_utc.replace(tzinfo=None).isoformat() + 'Z'
+    )
+    return metadata
+
+def cert_directories():
+    """Directories holding issued certificates, with the serial source of their file names"""
+    pki = f"{EASYRSA_DIR}/pki"
+    return (
+        (f"{pki}/issued", False),
+        (f"{pki}/certs_by_serial", True),
+        (f"{pki}/revoked/certs_by_serial", True)
+    )
+
+def pki_version():
+    """Identify the PKI state: index.txt plus the certificate directories"""
+    paths = [f"{EASYRSA_DIR}/pki/index.txt"] + [d for d, _ in cert_directories()]
+    return tuple(file_fingerprint(path) for path in paths)
+
+def build_cert_status_indexes():
+    """Build serial, common name and fingerprint hash indexes of the PKI"""
+    by_serial = {}
+    by_cn = {}
+    by_fingerprint = {}
+    
+    entries = cached_parse(f"{EASYRSA_DIR}/pki/index.txt", parse_index_status) or []
+    for entry in entries:
+        by_serial[entry[0]] = entry
+        by_cn.setdefault(entry[1], []).append(entry[0])
+    
+    for directory, named_by_serial in cert_directories():
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext not in ('.crt', '.pem'):
+                continue
+            try:
+                metadata = cached_parse(os.path.join(directory, name), parse_certificate_metadata)
+            except Exception as e:
+                print(f"Error reading certificate {name}: {e}")
+                continue
+            if metadata is None:
+                continue
+            sha256, sha1, serial = metadata['sha256'], metadata['sha1'], metadata['serial']
+            if serial is None:
+                if named_by_serial:
+                    serial = stem.upper()
+                else:
+                    # Without cryptography, map issued/<cn>.crt to the CN's newest entry
+                    serials = by_cn.get(stem)
+                    if not serials:
+                        continue
+                    serial = serials[-1]
+            by_fingerprint[sha256] = serial
+            by_fingerprint[sha1] = serial
+    
+    return {'serial': by_serial, 'cn': by_cn, 'fingerprint': by_fingerprint}
+
+def cert_status_indexes():
+    """Get the lookup indexes, rebuilding them when the PKI has changed"""
+    global _cert_status_cache
+    version = pki_version()
+    with _cert_status_lock:
+        if _cert_status_cache is None or _cert_status_cache[0] != version:
+            _cert_status_cache = (version, build_cert_status_indexes())
+        return _cert_status_cache[1]
+
+def describe_cert(serial, indexes, now):
+    """Describe the status of the certificate with this serial"""
+    entry = indexes['serial'].get(serial)
+    if entry is None:
+        return {'serial': serial, 'status': 'unknown'}
+    
+    serial, cn, flag, expiry, revoked_at = entry
+    if flag == 'R':
+        status = 'revoked'
+    elif flag == 'E' or parse_index_date(expiry) < now:
+        status = 'expired'
+    else:
+        status = 'valid'
+    return {
+        'serial': serial,
+        'cn': cn,
+        'status': status,
+        'expires': parse_index_date(expiry).isoformat() + 'Z',
+        'revoked_at': parse_index_date(revoked_at).isoformat() + 'Z' if revoked_at else None
+    }
+
+def lookup_cert_status(serials=(), fingerprints=(), cns=()):
+    """Look up certificate statuses by serial, fingerprint or common name"""
+    indexes = cert_status_indexes()
+    now = datetime.utcnow()
+    results = []
+    
+    for serial in serials:
+        serial = str(serial).strip().replace(':', '').upper()
+        results.append(dict(describe_cert(serial, indexes, now), query={'serial': serial}))
+    
+    for fingerprint in fingerprints:
+        fingerprint = str(fingerprint).strip().replace(':', '').lower()
+        serial = indexes['fingerprint'].get(fingerprint)
+        result = describe_cert(serial, indexes, now) if serial else {'status': 'unknown'}
+        results.append(dict(result, query={'fingerprint': fingerprint}))
+    
+    for cn in cns:
+        cn = str(cn).strip()
+        serials = indexes['cn'].get(cn, [])
+        if not serials:
+            results.append({'status': 'unknown', 'query': {'cn': cn}})
+        for serial in serials:
+            results.append(dict(describe_cert(serial, indexes, now), query={'cn': cn}))
+    
+    return results
+
+def issued_certificates():
+    """Map client names to their certificate files in pki/issued"""
+    directory = f"{EASYRSA_DIR}/pki/issued"
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    return {name[:-4]: os.path.join(directory, name) for name in names if name.endswith('.crt')}
+
+def read_certificate_metadata(cert_file):
+    """Get the (cached) metadata of a certificate file, or an error entry"""
+    try:
+        return cached_parse(cert_file, parse_certificate_metadata)
+    except Exception as e:
+        return {'error': str(e)}
+
+def certificate_index(names=None, workers=1):
+    """Metadata of issued client certificates by client name
+
+    Files are only parsed when they changed; with workers > 1 the ones
+    that did are parsed on a thread pool.
+    """
+    paths = issued_certificates()
+    if names is not None:
+        paths = {name: paths[name] for name in names if name in paths}
+    if workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            results = list(pool.map(read_certificate_metadata, paths.values()))
+    else:
+        results = [read_certificate_metadata(path) for path in paths.values()]
+    return {name: metadata for name, metadata in zip(paths, results) if metadata is not None}
+
+def warm_certificate_index():
+    """Parse every issued certificate once at startup, so lookups hit the cache"""
+    start = time.monotonic()
+    try:
+        indexed = len(certificate_index(workers=CERT_INDEX_WORKERS))
+    except Exception as e:
+        print(f"Error indexing certificates: {e}")
+        return
+    print(f"Indexed {indexed} certificates in {time.monotonic() - start:.1f}s")
+
+class ProfileSession:
+    """A profiling window over the requests served while it is open
+
+    In 'sample' mode a sampler thread records the stacks of threads that
+    are serving a request (and, with threads=True, of every other thread)
+    each interval, aggregated per endpoint; samples are wall-clock, so
+    waiting on locks and I/O shows up too. In 'cprofile' mode each request
+    runs under its own cProfile profiler and the stats are merged per
+    endpoint. Outside a window the request hooks only test a global.
+    """
+
+    def __init__(self, mode, seconds, interval, threads=False):
+        self.mode = mode
+        self.seconds = seconds
+        self.interval = interval
+        self.threads = threads
+        self.started = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.stopped = False
+        self.lock = threading.Lock()
+        # thread ident -> (endpoint, profiler or None)
+        self.serving = {}
+        self.requests = Counter()
+        self.stacks = {}
+        self.stats = {}
+        self.samples = 0
+        self.skipped = 0
+
+    @property
+    def active(self):
+        return not self.stopped and time.monotonic() < self.deadline
+
+    def stop(self):
+        self.stopped = True
+
+    def begin(self, endpoint):
+        """Start profiling the calling thread's request"""
+        profiler = None
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active (Python 3.12+ allows one)
+                profiler = None
+        with self.lock:
+            self.serving[threading.get_ident()] = (endpoint, profiler)
+            self.requests[endpoint] += 1
+            if self.mode == 'cprofile' and profiler is None:
+                self.skipped += 1
+
+    def end(self):
+        """Finish the calling thread's request, merging its profile"""
+        with self.lock:
+            endpoint, profiler = self.serving.pop(threading.get_ident(), (None, None))
+        if profiler is None:
+            return
+        profiler.disable()
+        with self.lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                self.stats[endpoint] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+
+    def run(self):
+        """Sampler loop (sample mode), until the window closes"""
+        own = threading.get_ident()
+        while self.active:
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()} if self.threads else {}
+            with self.lock:
+                for ident, frame in frames.items():
+                    serving = self.serving.get(ident)
+                    if serving is not None:
+                        label = serving[0]
+                    elif self.threads and ident != own:
+                        label = f"thread:{names.get(ident, ident)}"
+                    else:
+                        continue
+                    self.stacks.setdefault(label, Counter())[collapse_stack(frame)] += 1
+                self.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'started': datetime.utcfromtimestamp(self.started).isoformat() + 'Z',
+            'seconds': self.seconds,
+            'active': self.active,
+            'requests': dict(self.requests),
+            'samples': self.samples,
+            'skipped': self.skipped
+        }
+
+    def report(self, top):
+        """Top stacks (sample mode) or functions by cumulative time (cprofile) per endpoint"""
+        with self.lock:
+            if self.mode == 'sample':
+                return {label: {'samples': sum(counter.values()),
+                                'stacks': [{'stack': stack, 'count': count}
+                                           for stack, count in counter.most_common(top)]}
+                        for label, counter in self.stacks.items()}
+            return {endpoint: {'functions': top_functions(stats, top)}
+                    for endpoint, stats in self.stats.items()}
+
+    def dump(self, endpoint):
+        """The merged cProfile stats of an endpoint in pstats file format, or None"""
+        with self.lock:
+            stats = self.stats.get(endpoint)
+            return marshal.dumps(stats.stats) if stats is not None else None
+
+def collapse_stack(frame):
+    """Format a stack as 'outer;...;inner' of module:function, for flame graphs"""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def top_functions(stats, top):
+    """The functions of a pstats.Stats with the most cumulative time"""
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return [{
+        'function': f"{filename}:{line}({name})",
+        'calls': calls,
+        'primitive_calls': primitive_calls,
+        'total_seconds': round(total, 6),
+        'cumulative_seconds': round(cumulative, 6)
+    } for (filename, line, name), (primitive_calls, calls, total, cumulative, _) in entries]
+
+def start_profile(mode, seconds, interval, threads=False):
+    """Open a profiling window; returns None if one is already open"""
+    global _profile_session
+    with _profile_lock:
+        if _profile_session is not None and _profile_session.active:
+            return None
+        _profile_session = ProfileSession(mode, seconds, interval, threads)
+        if mode == 'sample':
+            threading.Thread(target=_profile_session.run, name='profiler', daemon=True).start()
+        return _profile_session
+
+def take_memory_snapshot():
+    """Snapshot traced allocations (starting tracemalloc if needed); returns (id, snapshot)"""
+    global _memory_snapshot_id
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')
+        ))
+        _memory_snapshot_id += 1
+        _memory_snapshots[_memory_snapshot_id] = (time.time(), snapshot)
+        while len(_memory_snapshots) > MEMORY_SNAPSHOTS:
+            del _memory_snapshots[next(iter(_memory_snapshots))]
+        return _memory_snapshot_id, snapshot
+
+def describe_memory_stat(stat, key_type):
+    """Serialize a tracemalloc Statistic or StatisticDiff"""
+    result = {
+        'size': stat.size,
+        'count': stat.count,
+        'size_formatted': format_bytes(stat.size)
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        result['size_diff'] = stat.size_diff
+        result['count_diff'] = stat.count_diff
+    if key_type == 'traceback':
+        result['traceback'] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    else:
+        frame = stat.traceback[0]
+        result['location'] = frame.filename if key_type == 'filename' else f"{frame.filename}:{frame.lineno}"
+    return result
+
+def memory_status():
+    current, peak = tracemalloc.get_traced_memory()
+    with _memory_lock:
+        snapshots = [{'id': snapshot_id, 'taken': datetime.utcfromtimestamp(taken).isoformat() + 'Z'}
+                     for snapshot_id, (taken, _) in _memory_snapshots.items()]
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'traced_current': current,
+        'traced_peak': peak,
+        'overhead': tracemalloc.get_tracemalloc_memory(),
+        'snapshots': snapshots
+    }
+
+@app.before_request
+def track_request_start():
+    global _active_requests
+    with _active_requests_lock:
+        _active_requests += 1
+    profile = _profile_session
+    if profile is not None and profile.active:
+        # Kept on g so the request is finished in the window it started in
+        g.profile = profile
+        profile.begin(request.endpoint or 'unmatched')
+
+@app.teardown_request
+def track_request_end(exc):
+    global _active_requests
+    with _active_requests_lock:
+        _active_requests -= 1
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.end()
+
+@app.after_request
+def compress_response(response):
+    """Gzip HTML and JSON responses for clients that accept it"""
+    if (response.direct_passthrough
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('text/html', 'application/json')
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 # API Routes
 @app.route('/api/stats')
@@ -324,15 +3426,208 @@ def api_clients():
     connected_clients = get_connected_clients()
     
     for client in clients:
-        conn_info = connected_clients.get(client['name'], {})
-        client['connected'] = conn_info.get('connected', False)
-        client['ip'] = conn_info.get('ip', '')
-        client['bytes_sent'] = conn_info.get('bytes_sent', 0)
-        client['bytes_received'] = conn_info.get('bytes_received', 0)
-        client['bytes_sent_formatted'] = format_bytes(conn_info.get('bytes_sent', 0))
-        client['bytes_received_formatted'] = format_bytes(conn_info.get('bytes_received', 0))
+        client.apply_usage(connected_clients.get(client.name))
+    
+    version = client_changes.update(clients)
+    since = request.args.get('since', '').strip()
+    if since:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'since must be a version number'}), 400
+        return jsonify({'success': True, **client_changes.changes_since(since)})
+    
+    response = jsonify([client.to_dict() for client in clients])
+    response.headers['X-Clients-Version'] = str(version)
+    return response
+
+TOP_METRICS = {
+    'rx': lambda usage: usage.rx_rate,
+    'tx': lambda usage: usage.tx_rate,
+    'total': lambda usage: usage.rx_rate + usage.tx_rate
+}
+
+@app.route('/api/clients/<client_name>/sessions')
+@login_required
+def api_client_sessions(client_name):
+    if not OPENVPN_LOG:
+        return jsonify({'success': False, 'message': 'Connection history is not configured (OPENVPN_LOG)'}), 404
+    
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = parse_time_param(since) if since else None
+        until = parse_time_param(until) if until else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since and until must be epoch seconds or ISO 8601'}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    
+    try:
+        sessions = client_sessions(client_name, since, until, limit)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({'success': True, 'name': client_name, 'sessions': sessions})
+
+@app.route('/api/top')
+@login_required
+def api_top():
+    metric = request.args.get('metric', 'total')
+    n = request.args.get('n', 10, type=int)
+    
+    if metric not in TOP_METRICS:
+        return jsonify({'success': False, 'message': 'metric must be rx, tx or total'}), 400
+    n = max(1, min(n, 100))
+    
+    return jsonify({'metric': metric, 'clients': top_clients(metric, n)})
+
+def top_clients(metric, n):
+    """The n connected clients with the highest throughput by metric"""
+    key = TOP_METRICS[metric]
+    top = heapq.nlargest(n, get_connected_clients().items(), key=lambda item: key(item[1]))
+    return [{
+        'name': name,
+        'ip': usage.ip,
+        'sessions': usage.sessions,
+        'rx_rate': usage.rx_rate,
+        'tx_rate': usage.tx_rate,
+        'rx_rate_formatted': format_rate(usage.rx_rate),
+        'tx_rate_formatted': format_rate(usage.tx_rate)
+    } for name, usage in top]
+
+def quota_status(client_name, entry, quota, now):
+    """Build the quota status of one client for the API"""
+    daily, monthly = period_usage(entry, now)
+    state = entry.get('quota', {})
+    period = {'daily': now.strftime('%Y-%m-%d'), 'monthly': now.strftime('%Y-%m')}
+    exceeded = state.get('exceeded') if state.get('period') == period.get(state.get('exceeded')) else None
+    return {
+        'name': client_name,
+        'daily_limit': quota.get('daily') if quota else None,
+        'monthly_limit': quota.get('monthly') if quota else None,
+        'action': quota.get('action') if quota else None,
+        'daily_used': daily,
+        'monthly_used': monthly,
+        'daily_used_formatted': format_bytes(daily),
+        'monthly_used_formatted': format_bytes(monthly),
+        'exceeded': exceeded
+    }
+
+@app.route('/api/quotas')
+@login_required
+def api_quotas():
+    quotas = load_quotas()
+    cumulative = load_client_stats()
+    now = datetime.now()
+    
+    clients = []
+    for client in unique_clients(get_clients()):
+        quota = quota_for(quotas, client.name)
+        if quota:
+            clients.append(quota_status(client.name, cumulative.get(client.name, {}), quota, now))
+    
+    return jsonify({'default': quotas.get('default', {}), 'clients': clients})
+
+@app.route('/api/quotas/<client_name>')
+@login_required
+def api_client_quota(client_name):
+    client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
+    quota = quota_for(load_quotas(), client_name)
+    entry = load_client_stats().get(client_name, {})
+    return jsonify(quota_status(client_name, entry, quota, datetime.now()))
+
+@app.route('/api/quotas', methods=['POST'])
+@login_required
+def set_quota():
+    data = request.get_json()
+    client_name = data.get('name', '').strip()
+    action = data.get('action', 'warn')
+    
+    if action not in ('warn', 'disconnect', 'revoke'):
+        return jsonify({'success': False, 'message': 'action must be warn, disconnect or revoke'}), 400
+    
+    quota = {'action': action}
+    try:
+        for period in ('daily', 'monthly'):
+            if data.get(period):
+                quota[period] = int(data[period])
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'daily and monthly must be byte counts'}), 400
+    
+    quotas = load_quotas()
+    if client_name:
+        client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
+        if len(quota) > 1:
+            quotas.setdefault('clients', {})[client_name] = quota
+        else:
+            quotas.setdefault('clients', {}).pop(client_name, None)
+    else:
+        quotas['default'] = quota if len(quota) > 1 else {}
+    
+    try:
+        save_quotas(quotas)
+        target = client_name or 'default'
+        return jsonify({'success': True, 'message': f'Quota for {target} updated successfully'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/lookup')
+@login_required
+def api_lookup():
+    ip = request.args.get('ip', '').strip()
+    cidr = request.args.get('cidr', '').strip()
+    if bool(ip) == bool(cidr):
+        return jsonify({'success': False, 'message': 'Give either ip or cidr'}), 400
+    
+    try:
+        address = ipaddress.ip_address(ip) if ip else ipaddress.ip_network(cidr, strict=False)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    address_index.refresh()
+    if ip:
+        return jsonify({'success': True, 'ip': str(address), **address_index.lookup_ip(address)})
+    return jsonify({'success': True, 'cidr': str(address), **address_index.lookup_network(address)})
+
+@app.route('/api/cert_status', methods=['GET', 'POST'])
+@login_required
+def api_cert_status():
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        serials = data.get('serials', [])
+        fingerprints = data.get('fingerprints', [])
+        cns = data.get('cns', [])
+        if not all(isinstance(v, list) for v in (serials, fingerprints, cns)):
+            return jsonify({'success': False, 'message': 'serials, fingerprints and cns must be lists'}), 400
+    else:
+        serials = request.args.getlist('serial')
+        fingerprints = request.args.getlist('fingerprint')
+        cns = request.args.getlist('cn')
     
-    return jsonify(clients)
+    if not (serials or fingerprints or cns):
+        return jsonify({'success': False, 'message': 'Give at least one serial, fingerprint or cn'}), 400
+    
+    try:
+        return jsonify({'success': True, 'results': lookup_cert_status(serials, fingerprints, cns)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/clients/<client_name>/cert')
+@login_required
+def api_client_cert(client_name):
+    metadata = certificate_index([client_name]).get(client_name)
+    if metadata is None:
+        return jsonify({'success': False, 'message': 'Certificate not found'}), 404
+    return jsonify({'success': True, 'name': client_name, 'cert': metadata})
+
+@app.route('/api/certs')
+@login_required
+def api_certs():
+    names = request.args.getlist('name') or None
+    try:
+        certs = certificate_index(names, CERT_INDEX_WORKERS)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({'success': True, 'certs': certs})
 
 @app.route('/api/add_client', methods=['POST'])
 @login_required
@@ -348,44 +3643,21 @@ def add_client():
     client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
     
     try:
+        if CERT_ENGINE == 'native':
+            try:
+                native_issue_client(client_name, expiry_days)
+            except FileExistsError:
+                pass
+            write_client_config(client_name, allow_duplicate)
+            return jsonify({'success': True, 'message': f'Client {client_name} created successfully'})
+        
         # Generate client certificate
-        gen_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch --days={expiry_days} build-client-full {client_name} nopass"
-        stdout, stderr, code = run_command(gen_cmd, shell=True)
+        stdout, stderr, code = run_easyrsa(f'--days={expiry_days}', 'build-client-full', client_name, 'nopass')
         
         if code != 0 and 'already exists' not in stderr:
             return jsonify({'success': False, 'message': f'Error creating certificate: {stderr}'}), 500
         
-        # Generate config file
-        inline_file = f"{EASYRSA_DIR}/pki/inline/{client_name}.inline"
-        
-        if os.path.exists(inline_file):
-            ovpn_cmd = f"grep -vh '^#' {OPENVPN_DIR}/client-common.txt {inline_file} > {CLIENT_CONFIG_DIR}/{client_name}.ovpn"
-        else:
-            ca_file = f"{OPENVPN_DIR}/ca.crt"
-            cert_file = f"{EASYRSA_DIR}/pki/issued/{client_name}.crt"
-            key_file = f"{EASYRSA_DIR}/pki/private/{client_name}.key"
-            tc_file = f"{OPENVPN_DIR}/tc.key"
-            
-            ovpn_cmd = f"""cat {OPENVPN_DIR}/client-common.txt > {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<ca>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {ca_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</ca>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<cert>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-openssl x509 -in {cert_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</cert>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<key>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {key_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</key>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<tls-crypt>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {tc_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</tls-crypt>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn"""
-        
-        run_command(ovpn_cmd, shell=True)
-        
-        # Add duplicate-cn if requested
-        if allow_duplicate:
-            dup_cmd = f"echo 'duplicate-cn' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn"
-            run_command(dup_cmd, shell=True)
+        write_easyrsa_client_config(client_name, allow_duplicate)
         
         return jsonify({'success': True, 'message': f'Client {client_name} created successfully'})
     
@@ -404,14 +3676,7 @@ def revoke_client():
     client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
     
     try:
-        revoke_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch revoke {client_name}"
-        run_command(revoke_cmd, shell=True)
-        
-        crl_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch --days=3650 gen-crl"
-        run_command(crl_cmd, shell=True)
-        
-        update_crl_cmd = f"cp {EASYRSA_DIR}/pki/crl.pem {OPENVPN_DIR}/crl.pem && chown nobody:nogroup {OPENVPN_DIR}/crl.pem 2>/dev/null || chown nobody:nobody {OPENVPN_DIR}/crl.pem"
-        run_command(update_crl_cmd, shell=True)
+        revoke_clients([client_name])
         
         return jsonify({'success': True, 'message': f'Client {client_name} revoked successfully'})
     except Exception as e:
@@ -429,41 +3694,41 @@ def delete_client():
     client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
     
     try:
-        revoke_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch revoke {client_name} 2>/dev/null || true"
-        run_command(revoke_cmd, shell=True)
-        
-        crl_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch --days=3650 gen-crl"
-        run_command(crl_cmd, shell=True)
-        
-        update_crl_cmd = f"cp {EASYRSA_DIR}/pki/crl.pem {OPENVPN_DIR}/crl.pem && chown nobody:nogroup {OPENVPN_DIR}/crl.pem 2>/dev/null || chown nobody:nobody {OPENVPN_DIR}/crl.pem"
-        run_command(update_crl_cmd, shell=True)
-        
-        files_to_delete = [
-            f"{EASYRSA_DIR}/pki/issued/{client_name}.crt",
-            f"{EASYRSA_DIR}/pki/private/{client_name}.key",
-            f"{EASYRSA_DIR}/pki/reqs/{client_name}.req",
-            f"{EASYRSA_DIR}/pki/inline/{client_name}.inline",
-            f"{CLIENT_CONFIG_DIR}/{client_name}.ovpn"
-        ]
-        
-        for file_path in files_to_delete:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
-        index_file = f"{EASYRSA_DIR}/pki/index.txt"
-        if os.path.exists(index_file):
-            with open(index_file, 'r') as f:
-                lines = f.readlines()
-            
-            with open(index_file, 'w') as f:
-                for line in lines:
-                    if f'/CN={client_name}' not in line:
-                        f.write(line)
+        delete_clients([client_name])
         
         return jsonify({'success': True, 'message': f'Client {client_name} completely deleted'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/bulk_delete_clients', methods=['POST'])
+@login_required
+def bulk_delete_clients():
+    data = request.get_json()
+    names = data.get('names', [])
+    
+    if not isinstance(names, list):
+        return jsonify({'success': False, 'message': 'names must be a list'}), 400
+    
+    client_names = []
+    for name in names:
+        name = str(name).strip()
+        if name:
+            client_names.append(re.sub(r'[^0-9a-zA-Z_-]', '_', name))
+    client_names = list(dict.fromkeys(client_names))
+    
+    if not client_names:
+        return jsonify({'success': False, 'message': 'At least one client name is required'}), 400
+    
+    try:
+        deleted = delete_clients(client_names)
+        return jsonify({
+            'success': True,
+            'message': f'{len(deleted)} clients deleted',
+            'deleted': sorted(deleted)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/edit_client', methods=['POST'])
 @login_required
 def edit_client():
@@ -493,11 +3758,42 @@ def edit_client():
             
             if allow_duplicate:
                 f.write('duplicate-cn\n')
+        invalidate_cached_file(config_file)
         
         return jsonify({'success': True, 'message': f'Client {client_name} updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/regenerate_configs', methods=['POST'])
+@login_required
+def regenerate_configs():
+    data = request.get_json(silent=True) or {}
+    names = data.get('names')
+    pattern = data.get('match')
+    
+    if names is not None and not isinstance(names, list):
+        return jsonify({'success': False, 'message': 'names must be a list'}), 400
+    
+    wanted = {re.sub(r'[^0-9a-zA-Z_-]', '_', str(name).strip()) for name in names} if names else None
+    client_names = [
+        c.name for c in get_clients()
+        if c.status == 'Active'
+        and (wanted is None or c.name in wanted)
+        and (not pattern or fnmatch(c.name, pattern))
+    ]
+    
+    job = start_config_regeneration(client_names)
+    if job is None:
+        return jsonify({'success': False, 'message': 'A regeneration is already running', 'job': _regen_job.to_dict()}), 409
+    return jsonify({'success': True, 'message': f'Regenerating {len(client_names)} client configs', 'job': job.to_dict()}), 202
+
+@app.route('/api/regenerate_configs')
+@login_required
+def regenerate_configs_status():
+    if _regen_job is None:
+        return jsonify({'success': False, 'message': 'No regeneration has run'}), 404
+    return jsonify({'success': True, 'job': _regen_job.to_dict()})
+
 @app.route('/api/extend_expiry', methods=['POST'])
 @login_required
 def extend_expiry():
@@ -511,34 +3807,17 @@ def extend_expiry():
     client_name = re.sub(r'[^0-9a-zA-Z_-]', '_', client_name)
     
     try:
-        renew_cmd = f"cd {EASYRSA_DIR} && ./easyrsa --batch --days={extend_days} renew {client_name} nopass"
-        run_command(renew_cmd, shell=True)
+        if CERT_ENGINE == 'native':
+            allow_duplicate = client_allows_multi_connection(client_name)
+            native_issue_client(client_name, extend_days, renew=True)
+            write_client_config(client_name, allow_duplicate)
+            return jsonify({'success': True, 'message': f'Certificate for {client_name} extended by {extend_days} days'})
         
-        inline_file = f"{EASYRSA_DIR}/pki/inline/{client_name}.inline"
-        
-        if os.path.exists(inline_file):
-            ovpn_cmd = f"grep -vh '^#' {OPENVPN_DIR}/client-common.txt {inline_file} > {CLIENT_CONFIG_DIR}/{client_name}.ovpn"
-        else:
-            ca_file = f"{OPENVPN_DIR}/ca.crt"
-            cert_file = f"{EASYRSA_DIR}/pki/issued/{client_name}.crt"
-            key_file = f"{EASYRSA_DIR}/pki/private/{client_name}.key"
-            tc_file = f"{OPENVPN_DIR}/tc.key"
-            
-            ovpn_cmd = f"""cat {OPENVPN_DIR}/client-common.txt > {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<ca>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {ca_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</ca>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<cert>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-openssl x509 -in {cert_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</cert>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<key>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {key_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</key>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '<tls-crypt>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-cat {tc_file} >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn
-echo '</tls-crypt>' >> {CLIENT_CONFIG_DIR}/{client_name}.ovpn"""
-        
-        run_command(ovpn_cmd, shell=True)
+        allow_duplicate = client_allows_multi_connection(client_name)
+        stdout, stderr, code = run_easyrsa(f'--days={extend_days}', 'renew', client_name, 'nopass')
+        if code != 0:
+            return jsonify({'success': False, 'message': f'Error renewing certificate: {stderr}'}), 500
+        write_easyrsa_client_config(client_name, allow_duplicate)
         
         return jsonify({'success': True, 'message': f'Certificate for {client_name} extended by {extend_days} days'})
     except Exception as e:
@@ -576,10 +3855,354 @@ def config_base64(client_name):
 @login_required
 def restart_server():
     try:
-        run_command('systemctl restart openvpn-server@server', shell=True)
+        _, stderr, code = run_command(['systemctl', 'restart', 'openvpn-server@server'], 'service')
+        if code != 0:
+            return jsonify({'success': False, 'message': stderr.strip()}), 500
         return jsonify({'success': True, 'message': 'Server restarted successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/debug/profile', methods=['GET', 'POST', 'DELETE'])
+@login_required
+def api_debug_profile():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode', 'sample')
+        if mode not in ('sample', 'cprofile'):
+            return jsonify({'success': False, 'message': 'mode must be sample or cprofile'}), 400
+        try:
+            seconds = float(data.get('seconds', 30))
+            interval = float(data.get('interval_ms', 5)) / 1000
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'seconds and interval_ms must be numbers'}), 400
+        if not 0 < seconds <= PROFILE_MAX_SECONDS or interval < 0.001:
+            return jsonify({'success': False,
+                            'message': f'seconds must be up to {PROFILE_MAX_SECONDS} and interval_ms at least 1'}), 400
+        profile = start_profile(mode, seconds, interval, bool(data.get('threads')))
+        if profile is None:
+            return jsonify({'success': False, 'message': 'A profiling window is already open'}), 409
+        return jsonify({'success': True, 'profile': profile.status()}), 202
+    
+    profile = _profile_session
+    if profile is None:
+        return jsonify({'success': False, 'message': 'No profile has been taken'}), 404
+    if request.method == 'DELETE':
+        profile.stop()
+        return jsonify({'success': True, 'profile': profile.status()})
+    top = max(1, min(request.args.get('top', 30, type=int), 500))
+    return jsonify({'success': True, 'profile': profile.status(), 'results': profile.report(top)})
+
+@app.route('/api/debug/profile/<endpoint>.prof')
+@login_required
+def api_debug_profile_dump(endpoint):
+    profile = _profile_session
+    data = profile.dump(endpoint) if profile is not None else None
+    if data is None:
+        return jsonify({'success': False, 'message': f'No cProfile stats for {endpoint}'}), 404
+    return send_file(io.BytesIO(data), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f"{endpoint}.prof")
+
+@app.route('/api/debug/memory', methods=['GET', 'DELETE'])
+@login_required
+def api_debug_memory():
+    if request.method == 'DELETE':
+        # Tracing costs memory and time on every allocation; stop it when done
+        with _memory_lock:
+            tracemalloc.stop()
+            _memory_snapshots.clear()
+    return jsonify({'success': True, **memory_status()})
+
+@app.route('/api/debug/memory/snapshot', methods=['POST'])
+@login_required
+def api_debug_memory_snapshot():
+    top = max(1, min(request.args.get('top', 20, type=int), 500))
+    snapshot_id, snapshot = take_memory_snapshot()
+    stats = snapshot.statistics('lineno')[:top]
+    return jsonify({'success': True, 'id': snapshot_id, **memory_status(),
+                    'top': [describe_memory_stat(stat, 'lineno') for stat in stats]})
+
+@app.route('/api/debug/memory/diff')
+@login_required
+def api_debug_memory_diff():
+    key_type = request.args.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'success': False, 'message': 'key_type must be lineno, filename or traceback'}), 400
+    top = max(1, min(request.args.get('top', 20, type=int), 500))
+    with _memory_lock:
+        ids = list(_memory_snapshots)
+        old_id = request.args.get('from', ids[0] if ids else None, type=int)
+        new_id = request.args.get('to', ids[-1] if ids else None, type=int)
+        old = _memory_snapshots.get(old_id)
+        new = _memory_snapshots.get(new_id)
+    if old is None or new is None:
+        return jsonify({'success': False, 'message': 'Unknown snapshot; take two with /api/debug/memory/snapshot'}), 404
+    
+    stats = new[1].compare_to(old[1], key_type)
+    return jsonify({'success': True, 'from': old_id, 'to': new_id,
+                    'size_diff': sum(stat.size_diff for stat in stats),
+                    'top': [describe_memory_stat(stat, key_type) for stat in stats[:top]]})
+
+# ASGI serving mode
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(wsgi_app, environ):
+    """Call a WSGI app to completion: (status, headers, body)"""
+    response = {}
+    
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+    
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_json(send, status, data):
+    body = json.dumps(data).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+class StatsBroadcaster:
+    """Dashboard stats computed once per STREAM_INTERVAL for every stream subscriber
+
+    The producer task only runs while someone is subscribed; the blocking
+    work (status log, index.txt, systemctl) runs in the default executor.
+    Changes to the status log or index.txt push a payload right away.
+    """
+
+    def __init__(self):
+        self.condition = None
+        self.wakeup = None
+        self.loop = None
+        self.payload = None
+        self.version = 0
+        self.subscribers = 0
+        self.task = None
+        file_watcher.subscribe(self.file_changed)
+
+    def file_changed(self, path):
+        """File watcher listener (runs on the watcher thread)"""
+        if self.task is not None and path in (STATUS_LOG, f"{EASYRSA_DIR}/pki/index.txt"):
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def build_payload(self):
+        return json.dumps({'stats': get_server_stats(), 'top': top_clients('total', 5)})
+
+    async def produce(self):
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            try:
+                payload = await loop.run_in_executor(None, self.build_payload)
+            except Exception as e:
+                payload = json.dumps({'error': str(e)})
+            async with self.condition:
+                self.payload = payload
+                self.version += 1
+                self.condition.notify_all()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), STREAM_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+        self.task = None
+
+    async def events(self):
+        """Yield each new payload, starting with the latest one"""
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+            self.wakeup = asyncio.Event()
+            self.loop = asyncio.get_running_loop()
+        self.subscribers += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.produce())
+        seen = 0
+        try:
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(lambda: self.version > seen)
+                    seen = self.version
+                    payload = self.payload
+                yield payload
+        finally:
+            self.subscribers -= 1
+
+class AsgiApp:
+    """ASGI front end for SERVER_MODE=asgi
+
+    Server-sent event streams and server restarts are handled natively on
+    the event loop, so hundreds of open dashboards or a slow systemctl do
+    not hold threads. Every other route goes to the Flask app on a
+    bounded thread pool (responses are buffered, not streamed).
+    """
+
+    def __init__(self, flask_app, threads):
+        self.flask_app = flask_app
+        self.threads = threads
+        self.executor = None
+        self.broadcaster = StatsBroadcaster()
+        self.routes = {
+            ('GET', '/api/stream'): self.stream,
+            ('POST', '/api/server/restart'): self.restart_server,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is None:
+                await self.call_flask(scope, receive, send)
+            elif not self.logged_in(scope):
+                await read_body(receive)
+                await send_json(send, 401, {'success': False, 'message': 'Login required'})
+            else:
+                await handler(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_background_workers(handle_signals=False)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                command_executor.cancel()
+                flush_client_stats()
+                save_snapshot()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def logged_in(self, scope):
+        """Check the Flask session cookie the way login_required does"""
+        cookie_name = self.flask_app.config['SESSION_COOKIE_NAME']
+        for name, value in scope.get('headers', []):
+            if name != b'cookie':
+                continue
+            for part in value.decode('latin-1').split(';'):
+                key, _, token = part.strip().partition('=')
+                if key != cookie_name:
+                    continue
+                serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+                try:
+                    data = serializer.loads(token, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+                except Exception:
+                    return False
+                return bool(data.get('logged_in'))
+        return False
+
+    async def call_flask(self, scope, receive, send):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='flask')
+        environ = wsgi_environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self.executor, run_wsgi, self.flask_app, environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def stream(self, scope, receive, send):
+        """Server-sent events with dashboard stats and top talkers"""
+        await read_body(receive)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        
+        async def forward():
+            async for payload in self.broadcaster.events():
+                await send({'type': 'http.response.body', 'body': f"data: {payload}\n\n".encode(), 'more_body': True})
+        
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def restart_server(self, scope, receive, send):
+        """Restart OpenVPN without tying up the event loop
+
+        The command goes through the shared executor on a thread, so it
+        takes the 'service' slot (restarts stay serialized with the
+        threaded view) and is killed with its process group after
+        RESTART_TIMEOUT.
+        """
+        await read_body(receive)
+        loop = asyncio.get_running_loop()
+        try:
+            _, stderr, code, timed_out = await loop.run_in_executor(
+                None, command_executor.execute, ['systemctl', 'restart', 'openvpn-server@server'], 'service')
+        except Exception as e:
+            await send_json(send, 500, {'success': False, 'message': str(e)})
+            return
+        if timed_out:
+            await send_json(send, 504, {'success': False, 'message': f"Restart timed out after {RESTART_TIMEOUT}s"})
+            return
+        if code != 0:
+            await send_json(send, 500, {'success': False, 'message': stderr.strip()})
+            return
+        await send_json(send, 200, {'success': True, 'message': 'Server restarted successfully'})
+
+asgi_app = AsgiApp(app, ASGI_WORKER_THREADS)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    host = os.environ.get('FLASK_HOST', '0.0.0.0')
+    port = int(os.environ.get('FLASK_PORT', 5000))
+    if SERVER_MODE == 'asgi':
+        try:
+            import uvicorn
+        except ImportError:
+            sys.exit('SERVER_MODE=asgi needs uvicorn (pip install uvicorn)')
+        uvicorn.run(asgi_app, host=host, port=port, lifespan='on')
+    else:
+        start_background_workers()
+        app.run(host=host, port=port, debug=False)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""Benchmarks for the OpenVPN Admin data paths
+
+Run against a synthetic PKI in a temporary directory, e.g.:
+
+    python benchmark.py records --clients 100000
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import app
+
+
+def make_pki(root, count):
+    """Write a synthetic index.txt with ``count`` client certificates"""
+    pki = os.path.join(root, 'pki')
+    os.makedirs(pki)
+    with open(os.path.join(pki, 'index.txt'), 'w') as f:
+        for i in range(count):
+            status = 'R' if i % 10 == 0 else 'V'
+            revoked = '250101000000Z' if status == 'R' else ''
+            f.write(f"{status}\t270101000000Z\t{revoked}\t{i:08X}\tunknown\t/CN=client{i}\n")
+    app.EASYRSA_DIR = root
+
+
+def legacy_client_rows(connected_clients, cumulative_stats):
+    """Build per-client dicts the way clients_page() did before ClientRecord"""
+    clients = []
+    with open(f"{app.EASYRSA_DIR}/pki/index.txt", 'r') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) >= 6:
+                cn_match = re.search(r'/CN=([^/]+)', parts[5])
+                if cn_match:
+                    clients.append({
+                        'name': cn_match.group(1),
+                        'status': 'Active' if parts[0] == 'V' else 'Revoked',
+                        'expiry': app.parse_openvpn_date(parts[1])
+                    })
+    for client in clients:
+        conn_info = connected_clients.get(client['name'], {})
+        client['connected'] = conn_info.get('connected', False)
+        client['real_address'] = conn_info.get('ip', '')
+        client_cumulative = cumulative_stats.get(client['name'], {})
+        cumulative_sent = client_cumulative.get('total_sent', 0) + client_cumulative.get('last_sent', 0)
+        cumulative_received = client_cumulative.get('total_received', 0) + client_cumulative.get('last_received', 0)
+        client['bytes_sent'] = '-'
+        client['bytes_received'] = '-'
+        client['cumulative_sent'] = app.format_bytes(cumulative_sent)
+        client['cumulative_received'] = app.format_bytes(cumulative_received)
+        client['expiry_date'] = client.get('expiry', 'N/A')
+        client['allow_multi_connection'] = False
+    return clients
+
+
+def record_client_rows(connected_clients, cumulative_stats):
+    """Build ClientRecords the way clients_page() does now"""
+    clients = app.get_clients()
+    for client in clients:
+        client.apply_usage(connected_clients.get(client.name))
+        client_cumulative = cumulative_stats.get(client.name, {})
+        client.cumulative_sent = client_cumulative.get('total_sent', 0) + client_cumulative.get('last_sent', 0)
+        client.cumulative_received = client_cumulative.get('total_received', 0) + client_cumulative.get('last_received', 0)
+    return clients
+
+
+def measure(func, *args):
+    """Return (result, seconds, bytes still allocated, peak bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def bench_records(args):
+    root = tempfile.mkdtemp()
+    try:
+        make_pki(root, args.clients)
+        cumulative_stats = {
+            f"client{i}": {'total_sent': i * 1024, 'total_received': i * 2048, 'last_sent': 0, 'last_received': 0}
+            for i in range(args.clients)
+        }
+        print(f"{args.clients} clients")
+        print(f"{'implementation':<16}{'time (s)':>10}{'retained (MB)':>16}{'peak (MB)':>12}")
+        # The second ClientRecord run reuses the cached index.txt entries,
+        # so it retains only the records themselves
+        for label, func in (('dict rows', legacy_client_rows), ('ClientRecord', record_client_rows),
+                            ('ClientRecord*', record_client_rows)):
+            rows, elapsed, current, peak = measure(func, {}, cumulative_stats)
+            print(f"{label:<16}{elapsed:>10.3f}{current / 2**20:>16.1f}{peak / 2**20:>12.1f}")
+            del rows
+        print("* index.txt entries already cached")
+    finally:
+        shutil.rmtree(root)
+
+
+def write_status_log(path, count, version):
+    """Write a synthetic status log with ``count`` connections"""
+    sep = '\t' if version == 3 else ','
+    with open(path, 'w') as f:
+        if version == 1:
+            f.write('OpenVPN CLIENT LIST\nUpdated,2025-01-01 00:00:00\n')
+            f.write('Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n')
+            for i in range(count):
+                f.write(f"client{i},203.0.113.{i % 250}:{1024 + i},{i * 1000},{i * 3000},2025-01-01 00:00:00\n")
+            f.write('ROUTING TABLE\nVirtual Address,Common Name,Real Address,Last Ref\n')
+            for i in range(count):
+                f.write(f"10.8.{i // 250}.{i % 250 + 2},client{i},203.0.113.{i % 250}:{1024 + i},2025-01-01 00:00:00\n")
+            f.write('GLOBAL STATS\nMax bcast/mcast queue length,0\nEND\n')
+            return
+        f.write(sep.join(['TITLE', 'OpenVPN 2.6 benchmark']) + '\n')
+        f.write(sep.join(['TIME', '2025-01-01 00:00:00', '1735689600']) + '\n')
+        f.write(sep.join(['HEADER', 'CLIENT_LIST'] + list(app.STATUS_DEFAULT_COLUMNS['CLIENT_LIST'])) + '\n')
+        for i in range(count):
+            f.write(sep.join(['CLIENT_LIST', f"client{i}", f"203.0.113.{i % 250}:{1024 + i}",
+                              f"10.8.{i // 250}.{i % 250 + 2}", '', str(i * 1000), str(i * 3000),
+                              '2025-01-01 00:00:00', '1735689600', 'UNDEF', str(i), str(i),
+                              'AES-256-GCM']) + '\n')
+        f.write(sep.join(['HEADER', 'ROUTING_TABLE'] + list(app.STATUS_DEFAULT_COLUMNS['ROUTING_TABLE'])) + '\n')
+        for i in range(count):
+            f.write(sep.join(['ROUTING_TABLE', f"10.8.{i // 250}.{i % 250 + 2}", f"client{i}",
+                              f"203.0.113.{i % 250}:{1024 + i}", '2025-01-01 00:00:00', '1735689600']) + '\n')
+        f.write(sep.join(['GLOBAL_STATS', 'Max bcast/mcast queue length', '0']) + '\n')
+        f.write('END\n')
+
+
+def legacy_read_connections(path):
+    """Parse CLIENT_LIST rows the way get_connected_clients() used to"""
+    connections = []
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    for line in lines:
+        if line.startswith('CLIENT_LIST,') and 'Common Name' not in line:
+            parts = line.strip().split(',')
+            if len(parts) >= 13 and parts[1] != 'UNDEF':
+                connections.append(app.Connection(
+                    parts[1], parts[2], parts[3],
+                    int(parts[5]) if parts[5].isdigit() else 0,
+                    int(parts[6]) if parts[6].isdigit() else 0,
+                    parts[7], int(parts[8]) if parts[8].isdigit() else 0, parts[10]))
+    return connections
+
+
+def streaming_read_connections(path):
+    return app.connections_from_records(app.read_status_records(path))
+
+
+def bench_status(args):
+    root = tempfile.mkdtemp()
+    try:
+        print(f"{args.connections} connections")
+        print(f"{'format':<10}{'implementation':<16}{'time (s)':>10}{'peak (MB)':>12}{'parsed':>9}")
+        for version in (1, 2, 3):
+            path = os.path.join(root, f"status-v{version}.log")
+            write_status_log(path, args.connections, version)
+            implementations = [('streaming', streaming_read_connections)]
+            if version == 2:
+                implementations.insert(0, ('readlines', legacy_read_connections))
+            for label, func in implementations:
+                connections, elapsed, _, peak = measure(func, path)
+                print(f"v{version:<9}{label:<16}{elapsed:>10.3f}{peak / 2**20:>12.1f}{len(connections):>9}")
+                del connections
+    finally:
+        shutil.rmtree(root)
+
+
+class FakeManagement:
+    """Scripted OpenVPN management interface for driving ConnectionTracker
+
+    Accepts one connection, answers ``bytecount`` and ``status 2`` (from a
+    status log with ``initial`` sessions), then plays CONNECT, ESTABLISHED,
+    BYTECOUNT_CLI and DISCONNECT notifications for ``count`` clients,
+    checking that every CONNECT is answered with client-auth-nt.
+    """
+
+    def __init__(self, status_log, count):
+        self.status_log = status_log
+        self.count = count
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.address = '127.0.0.1:%d' % self.server.getsockname()[1]
+        self.established = threading.Event()
+        self.disconnect = threading.Event()
+        self.done = threading.Event()
+        self.errors = []
+
+    def expect(self, reader, expected):
+        line = reader.readline().rstrip('\n')
+        if line != expected:
+            self.errors.append(f"expected {expected!r}, got {line!r}")
+
+    def client_block(self, kind, args, env):
+        lines = [f">CLIENT:{kind},{args}"]
+        lines += [f">CLIENT:ENV,{name}={value}" for name, value in env.items()]
+        lines.append('>CLIENT:ENV,END')
+        return ''.join(f"{line}\n" for line in lines).encode()
+
+    def run(self):
+        conn, _ = self.server.accept()
+        # Notifications are small writes; don't let Nagle hold them for the reply's ACK
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn, conn.makefile('r') as reader:
+            conn.sendall(b">INFO:OpenVPN Management Interface Version 5 -- type 'help' for more info\n")
+            self.expect(reader, f"bytecount {app.BYTECOUNT_INTERVAL}")
+            conn.sendall(b"SUCCESS: bytecount interval changed\n")
+            self.expect(reader, 'status 2')
+            with open(self.status_log, 'rb') as f:
+                conn.sendall(f.read())
+            
+            for i in range(self.count):
+                cid = 100000 + i
+                conn.sendall(self.client_block('CONNECT', f"{cid},0", {'common_name': f"event{i}"}))
+                self.expect(reader, f"client-auth-nt {cid} 0")
+                conn.sendall(self.client_block('ESTABLISHED', cid, {
+                    'common_name': f"event{i}",
+                    'trusted_ip': f"198.51.100.{i % 250}",
+                    'trusted_port': 40000 + i % 20000,
+                    'ifconfig_pool_remote_ip': f"10.9.{i // 250}.{i % 250 + 2}",
+                    'time_ascii': '2025-01-01 00:00:00',
+                    'time_unix': 1735689600
+                }))
+                conn.sendall(f">BYTECOUNT_CLI:{cid},{i * 10},{i * 20}\n".encode())
+            self.established.set()
+            
+            self.disconnect.wait()
+            for i in range(self.count):
+                cid = 100000 + i
+                conn.sendall(self.client_block('DISCONNECT', cid, {
+                    'common_name': f"event{i}", 'bytes_received': i * 100, 'bytes_sent': i * 200}))
+            self.done.set()
+            # Hold the connection until the benchmark is finished with it
+            conn.recv(1)
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def run_events(root, clients, initial):
+    """Drive a ConnectionTracker through ``clients`` scripted sessions
+
+    Returns (timings, checks): timings as (label, seconds, events), checks
+    as (label, ok, detail).
+    """
+    status_log = os.path.join(root, f"status-{clients}.log")
+    write_status_log(status_log, initial, 2)
+    app.STATS_FILE = os.path.join(root, f"client_stats-{clients}.json")
+    fake = FakeManagement(status_log, clients)
+    app.MANAGEMENT_ADDRESS = fake.address
+    app.MANAGEMENT_PASSWORD = ''
+    tracker = app.ConnectionTracker()
+    
+    start = time.perf_counter()
+    threading.Thread(target=fake.run, daemon=True).start()
+    threading.Thread(target=tracker.run, daemon=True).start()
+    
+    fake.established.wait(60)
+    connected = wait_for(lambda: len(tracker.snapshot()[0]) == initial + clients
+                         and tracker.snapshot()[0][-1].bytes_sent == (clients - 1) * 20)
+    established = time.perf_counter()
+    fake.disconnect.set()
+    fake.done.wait(60)
+    disconnected = wait_for(lambda: len(tracker.snapshot()[0]) == initial)
+    
+    def accounted_sent(stats):
+        return sum(entry['total_sent'] for name, entry in stats.items() if name.startswith('event'))
+    
+    def accounted_in_memory():
+        with app._stats_lock:
+            return accounted_sent(app.load_client_stats())
+    
+    # A session leaves the table just before its final counts are accounted
+    expected = sum(i * 200 for i in range(clients))
+    wait_for(lambda: accounted_in_memory() == expected, 10)
+    finished = time.perf_counter()
+    accounted = accounted_in_memory()
+    
+    # Disconnects are accounted in memory; the stats sampler saves them
+    app.flush_client_stats()
+    with open(app.STATS_FILE) as f:
+        saved = accounted_sent(json.load(f))
+    
+    timings = [
+        ('connect + established + bytecount', established - start, clients * 3),
+        ('disconnect', finished - established, clients),
+        ('all events', finished - start, clients * 4)
+    ]
+    checks = [
+        ('CONNECTs approved', not fake.errors, '; '.join(fake.errors[:3])),
+        ('sessions tracked', connected, ''),
+        ('sessions closed', disconnected, ''),
+        ('final bytes accounted', accounted == expected, f"{accounted} != {expected}"),
+        ('final bytes saved', saved == expected, f"{saved} != {expected}")
+    ]
+    return timings, checks
+
+
+def bench_events(args):
+    root = tempfile.mkdtemp()
+    try:
+        print(f"{args.initial} sessions from status 2")
+        checks = []
+        rates = []
+        for clients in (args.clients, args.clients * args.scale):
+            timings, run_checks = run_events(root, clients, args.initial)
+            print(f"{clients} scripted clients")
+            for label, elapsed, events in timings:
+                print(f"  {label:<34}{elapsed:>8.3f} s{events / elapsed:>10.0f} events/s")
+            checks += [(f"{label} ({clients})", ok, detail) for label, ok, detail in run_checks]
+            rates.append(timings[-1][2] / timings[-1][1])
+        # Per-event work must not grow with the number of clients; allow
+        # for timing noise, not for a cost that scales with the table
+        checks.append(('events/s holds as clients grow', rates[1] >= rates[0] * 0.5,
+                       f"{rates[0]:.0f} -> {rates[1]:.0f} events/s"))
+        for label, ok, detail in checks:
+            print(f"{label:<44}{'ok' if ok else 'FAILED ' + detail}")
+        if not all(ok for _, ok, _ in checks):
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_changes(args):
+    root = tempfile.mkdtemp()
+    try:
+        make_pki(root, args.clients)
+        # Renew every tenth client: its revoked line stays next to the new valid one
+        with open(os.path.join(root, 'pki', 'index.txt'), 'a') as f:
+            for i in range(0, args.clients, 10):
+                f.write(f"V\t280101000000Z\t\t{args.clients + i:08X}\tunknown\t/CN=client{i}\n")
+        log = app.ClientChangeLog()
+        timings = []
+        for label in ('first poll', 'no-op poll'):
+            start = time.perf_counter()
+            version = log.update(app.get_clients())
+            timings.append((label, time.perf_counter() - start, version))
+        delta = log.changes_since(timings[0][2])
+        records = log.changes_since(0)['added']
+        
+        print(f"{args.clients} clients, {len(records) - args.clients} renewed")
+        for label, elapsed, _ in timings:
+            print(f"{label:<16}{elapsed:>10.3f} s")
+        checks = [
+            ('no-op poll keeps the version', timings[1][2] == timings[0][2], f"{timings[0][2]} -> {timings[1][2]}"),
+            ('no-op poll has an empty delta', not (delta['added'] or delta['changed'] or delta['removed']),
+             f"{len(delta['added'])} added, {len(delta['changed'])} changed, {len(delta['removed'])} removed"),
+            ('revoked and renewed records kept', len(records) == args.clients + len(range(0, args.clients, 10)),
+             f"{len(records)} records")
+        ]
+        for label, ok, detail in checks:
+            print(f"{label:<36}{'ok' if ok else 'FAILED ' + detail}")
+        if not all(ok for _, ok, _ in checks):
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_rows(args):
+    root = tempfile.mkdtemp()
+    try:
+        make_pki(root, args.clients)
+        clients = app.get_clients()
+        with app.app.app_context():
+            timings = []
+            for label in ('cold', 'warm'):
+                start = time.perf_counter()
+                app.render_client_rows(clients)
+                timings.append((label, time.perf_counter() - start))
+            clients[0].connected = True
+            start = time.perf_counter()
+            app.render_client_rows(clients)
+            timings.append(('one row changed', time.perf_counter() - start))
+        print(f"{args.clients} clients")
+        for label, elapsed in timings:
+            print(f"{label:<16}{elapsed:>10.3f} s")
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    records = sub.add_parser('records', help='memory of per-client rows built for /clients')
+    records.add_argument('--clients', type=int, default=100000)
+    records.set_defaults(func=bench_records)
+
+    rows = sub.add_parser('rows', help='rendering the clients table rows with the fragment cache')
+    rows.add_argument('--clients', type=int, default=10000)
+    rows.set_defaults(func=bench_rows)
+
+    changes = sub.add_parser('changes', help='client change log polls with renewed (duplicate CN) clients')
+    changes.add_argument('--clients', type=int, default=10000)
+    changes.set_defaults(func=bench_changes)
+
+    status = sub.add_parser('status', help='parsing status logs of each status-version')
+    status.add_argument('--connections', type=int, default=10000)
+    status.set_defaults(func=bench_status)
+
+    events = sub.add_parser('events', help='event-driven connection tracking against a scripted management interface')
+    events.add_argument('--clients', type=int, default=1000)
+    events.add_argument('--initial', type=int, default=100, help='sessions in the bootstrap status 2 reply')
+    events.add_argument('--scale', type=int, default=4, help='the second run uses this many times the clients')
+    events.set_defaults(func=bench_events)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
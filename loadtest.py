@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Concurrent load test for the OpenVPN Admin panel
+
+Starts app.py against a synthetic PKI (with stub easyrsa and systemctl on
+its command PATH), logs in once per simulated session and drives a
+weighted mix of pages and API calls, then reports latency percentiles,
+throughput and error rates per endpoint:
+
+    python loadtest.py --sessions 50 --duration 30 --clients 5000
+
+Use --url to target an already running panel instead. Against a running
+panel the write action (which creates, edits and deletes real clients and
+regenerates the CRL) is left out unless --allow-writes is given; only pass
+it for a test server.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEFAULT_MIX = 'dashboard=2,clients=2,api_clients=4,api_stats=4,write=1'
+
+EASYRSA_STUB = """#!/bin/sh
+# Stub easyrsa: records the call and updates the PKI just enough for the panel
+for arg in "$@"; do
+    case "$arg" in
+        build-client-full) action=build ;;
+        revoke) action=revoke ;;
+        gen-crl) action=crl ;;
+        --*) ;;
+        *) [ -n "$action" ] && [ -z "$name" ] && name="$arg" ;;
+    esac
+done
+case "$action" in
+    build)
+        serial=$(od -An -N16 -tx1 /dev/urandom | tr -d ' \\n' | tr a-f A-F)
+        printf 'V\\t270101000000Z\\t\\t%s\\tunknown\\t/CN=%s\\n' "$serial" "$name" >> pki/index.txt
+        printf '<cert>\\nstub\\n</cert>\\n' > "pki/inline/$name.inline"
+        ;;
+    crl)
+        touch pki/crl.pem
+        ;;
+esac
+exit 0
+"""
+
+SYSTEMCTL_STUB = """#!/bin/sh
+# Stub systemctl: the OpenVPN service is always active
+[ "$1" = "is-active" ] && echo active
+exit 0
+"""
+
+
+def write_executable(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+
+
+def make_environment(root, clients, connected):
+    """Create a synthetic PKI, status log and stub commands under root"""
+    easyrsa = os.path.join(root, 'easy-rsa')
+    openvpn = os.path.join(root, 'server')
+    configs = os.path.join(root, 'clients')
+    data = os.path.join(root, 'data')
+    stubs = os.path.join(root, 'bin')
+    for path in ('pki/issued', 'pki/private', 'pki/reqs', 'pki/inline'):
+        os.makedirs(os.path.join(easyrsa, path))
+    for path in (openvpn, configs, data, stubs):
+        os.makedirs(path)
+
+    with open(os.path.join(easyrsa, 'pki', 'index.txt'), 'w') as f:
+        for i in range(clients):
+            status = 'R' if i % 10 == 0 else 'V'
+            revoked = '250101000000Z' if status == 'R' else ''
+            f.write(f"{status}\t270101000000Z\t{revoked}\t{i:08X}\tunknown\t/CN=client{i}\n")
+    for i in range(clients):
+        with open(os.path.join(configs, f"client{i}.ovpn"), 'w') as f:
+            f.write('client\n' + ('duplicate-cn\n' if i % 5 == 0 else ''))
+
+    status_log = os.path.join(root, 'status.log')
+    with open(status_log, 'w') as f:
+        f.write('TITLE,OpenVPN 2.6 stub\nTIME,2025-01-01 00:00:00,1735689600\n')
+        f.write('HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address,Virtual IPv6 Address,'
+                'Bytes Received,Bytes Sent,Connected Since,Connected Since (time_t),Username,'
+                'Client ID,Peer ID,Data Channel Cipher\n')
+        for i in range(min(connected, clients)):
+            f.write(f"CLIENT_LIST,client{i},203.0.113.{i % 250}:{1024 + i},10.8.{i // 250}.{i % 250 + 2},,"
+                    f"{i * 1000},{i * 3000},2025-01-01 00:00:00,1735689600,UNDEF,{i},{i},AES-256-GCM\n")
+        f.write('GLOBAL_STATS,Max bcast/mcast queue length,0\nEND\n')
+
+    with open(os.path.join(openvpn, 'server.conf'), 'w') as f:
+        f.write('port 1194\nproto udp\n')
+    with open(os.path.join(openvpn, 'client-common.txt'), 'w') as f:
+        f.write('client\ndev tun\nproto udp\nremote 192.0.2.1 1194\n')
+    for name in ('ca.crt', 'tc.key'):
+        with open(os.path.join(openvpn, name), 'w') as f:
+            f.write('stub\n')
+
+    write_executable(os.path.join(easyrsa, 'easyrsa'), EASYRSA_STUB)
+    write_executable(os.path.join(stubs, 'systemctl'), SYSTEMCTL_STUB)
+
+    return {
+        'EASYRSA_DIR': easyrsa,
+        'OPENVPN_DIR': openvpn,
+        'CLIENT_CONFIG_DIR': configs,
+        'OPENVPN_STATUS': status_log,
+        'DATA_DIR': data,
+        'COMMAND_PATH': f"{stubs}:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env_overrides, port, password):
+    """Run app.py in a subprocess and wait until it accepts connections"""
+    env = os.environ.copy()
+    env.update(env_overrides)
+    env.update({
+        'FLASK_HOST': '127.0.0.1',
+        'FLASK_PORT': str(port),
+        'ADMIN_USERNAME': 'admin',
+        'ADMIN_PASSWORD': password,
+        'SECRET_KEY': 'loadtest',
+    })
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    proc = subprocess.Popen([sys.executable, app_path], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('app.py exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError('app.py did not start listening in time')
+
+
+class Session:
+    """One logged-in browser or API poller"""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        with self.opener.open(f"{base_url}/login", body, timeout=30) as response:
+            response.read()
+            if response.url.rstrip('/').endswith('/login'):
+                raise RuntimeError('login failed')
+
+    def request(self, path, payload=None):
+        """Send a request and return the HTTP status"""
+        data = None
+        headers = {'Accept-Encoding': 'gzip'}
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(f"{self.base_url}{path}", data=data, headers=headers)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error collection"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+_write_names = itertools.count()
+
+
+def do_write(session, recorder):
+    """Create a client, toggle its multi-connection flag, then delete it"""
+    name = f"loadtest_{os.getpid()}_{next(_write_names)}"
+    for path, payload in (
+        ('/api/add_client', {'name': name, 'expiry_days': 30}),
+        ('/api/edit_client', {'name': name, 'allow_duplicate': True}),
+        ('/api/delete_client', {'name': name}),
+    ):
+        timed_request(session, recorder, f"POST {path}", path, payload)
+
+
+def timed_request(session, recorder, endpoint, path, payload=None):
+    start = time.perf_counter()
+    try:
+        status = session.request(path, payload)
+    except Exception:
+        status = 599
+    recorder.record(endpoint, time.perf_counter() - start, status < 400)
+
+
+ACTIONS = {
+    'dashboard': ('GET /', '/'),
+    'clients': ('GET /clients', '/clients'),
+    'api_clients': ('GET /api/clients', '/api/clients'),
+    'api_stats': ('GET /api/stats', '/api/stats'),
+    'api_top': ('GET /api/top', '/api/top?metric=total&n=10'),
+}
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name != 'write' and name not in ACTIONS:
+            raise SystemExit(f"unknown action in mix: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def worker(base_url, password, mix, deadline, recorder, think_time):
+    try:
+        session = Session(base_url, 'admin', password)
+    except Exception as e:
+        recorder.record('POST /login', 0.0, False)
+        print(f"login failed: {e}", file=sys.stderr)
+        return
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    while time.time() < deadline:
+        action = random.choices(names, weights)[0]
+        if action == 'write':
+            do_write(session, recorder)
+        else:
+            endpoint, path = ACTIONS[action]
+            timed_request(session, recorder, endpoint, path)
+        if think_time:
+            time.sleep(random.uniform(0, think_time))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(recorder, elapsed):
+    print(f"{'endpoint':<26}{'requests':>9}{'req/s':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    total_errors = 0
+    for endpoint in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[endpoint])
+        errors = recorder.errors.get(endpoint, 0)
+        total += len(values)
+        total_errors += errors
+        print(f"{endpoint:<26}{len(values):>9}{len(values) / elapsed:>9.1f}"
+              f"{errors / len(values):>8.1%} "
+              f"{percentile(values, 0.50) * 1000:>8.1f} "
+              f"{percentile(values, 0.95) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f}")
+    if total:
+        print(f"{'total':<26}{total:>9}{total / elapsed:>9.1f}{total_errors / total:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='target a running panel instead of starting one')
+    parser.add_argument('--password', default='loadtest', help='admin password (with --url)')
+    parser.add_argument('--allow-writes', action='store_true',
+                        help='with --url, run the write action (creates and deletes real clients)')
+    parser.add_argument('--sessions', type=int, default=20, help='concurrent logged-in sessions')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"weighted actions: {', '.join(ACTIONS)}, write (default {DEFAULT_MIX})")
+    parser.add_argument('--think-time', type=float, default=0.0, help='max random pause between requests')
+    parser.add_argument('--clients', type=int, default=1000, help='synthetic certificates')
+    parser.add_argument('--connected', type=int, default=200, help='synthetic connected sessions')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic environment')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.url and not args.allow_writes and any(name == 'write' for name, _ in mix):
+        if args.mix != DEFAULT_MIX:
+            raise SystemExit('write in --mix against --url changes real clients; add --allow-writes')
+        mix = [(name, weight) for name, weight in mix if name != 'write']
+        print('--url without --allow-writes: leaving write out of the mix')
+    root = None
+    proc = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            password = args.password
+        else:
+            root = tempfile.mkdtemp(prefix='openvpn-admin-loadtest.')
+            env = make_environment(root, args.clients, args.connected)
+            port = free_port()
+            password = 'loadtest'
+            proc = start_server(env, port, password)
+            base_url = f"http://127.0.0.1:{port}"
+            print(f"synthetic PKI with {args.clients} clients ({args.connected} connected) in {root}")
+
+        recorder = Recorder()
+        deadline = time.time() + args.duration
+        threads = [threading.Thread(target=worker, args=(base_url, password, mix, deadline, recorder, args.think_time))
+                   for _ in range(args.sessions)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        mix_text = ','.join(f"{name}={weight:g}" for name, weight in mix)
+        print(f"{args.sessions} sessions for {elapsed:.1f} s, mix {mix_text}")
+        report(recorder, elapsed)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if root is not None and not args.keep:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -266,10 +266,13 @@ ssbzSibBsu/6iGtCOGEoXJf//////////wIBAg==
 -----END DH PARAMETERS-----' > /etc/openvpn/server/dh.pem
 	# Make easy-rsa aware of our external DH file (prevents a warning)
 	ln -s /etc/openvpn/server/dh.pem pki/dh.pem
-	# Create certificates and CRL
-	./easyrsa --batch --days=3650 build-server-full server nopass
-	./easyrsa --batch --days=3650 build-client-full "$client" nopass
-	./easyrsa --batch --days=3650 gen-crl
+	# Create certificates and CRL, holding the PKI lock shared with OpenVPN Admin
+	(
+		flock 9
+		./easyrsa --batch --days=3650 build-server-full server nopass
+		./easyrsa --batch --days=3650 build-client-full "$client" nopass
+		./easyrsa --batch --days=3650 gen-crl
+	) 9>>pki/.openvpn-admin.lock
 	# Move the stuff we need
 	cp pki/ca.crt pki/private/ca.key pki/issued/server.crt pki/private/server.key pki/crl.pem /etc/openvpn/server
 	cp pki/private/easyrsa-tls.key /etc/openvpn/server/tc.key
@@ -476,7 +479,8 @@ else
 				client=$(sed 's/[^0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_-]/_/g' <<< "$unsanitized_client")
 			done
 			cd /etc/openvpn/server/easy-rsa/
-			./easyrsa --batch --days=3650 build-client-full "$client" nopass
+			# Hold the PKI lock shared with OpenVPN Admin
+			flock pki/.openvpn-admin.lock ./easyrsa --batch --days=3650 build-client-full "$client" nopass
 			# Build the $client.ovpn file, stripping comments from easy-rsa in the process
 			grep -vh '^#' /etc/openvpn/server/client-common.txt /etc/openvpn/server/easy-rsa/pki/inline/private/"$client".inline > "$script_dir"/"$client".ovpn
 			echo
@@ -509,8 +513,12 @@ else
 			done
 			if [[ "$revoke" =~ ^[yY]$ ]]; then
 				cd /etc/openvpn/server/easy-rsa/
-				./easyrsa --batch revoke "$client"
-				./easyrsa --batch --days=3650 gen-crl
+				# Hold the PKI lock shared with OpenVPN Admin
+				(
+					flock 9
+					./easyrsa --batch revoke "$client"
+					./easyrsa --batch --days=3650 gen-crl
+				) 9>>pki/.openvpn-admin.lock
 				rm -f /etc/openvpn/server/crl.pem
 				rm -f /etc/openvpn/server/easy-rsa/pki/reqs/"$client".req
 				rm -f /etc/openvpn/server/easy-rsa/pki/private/"$client".key